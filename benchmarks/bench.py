@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+'''Benchmarks for the render, quantize and I/O hot paths of minecraftmap.
+
+Uses synthetic map files and images only, so no world data is needed. Every benchmark
+runs --repeat times after one warm-up call, with any per-run setup excluded from the
+timing, and reports the median and minimum seconds per call together with the
+throughput in maps and megapixels per second. Results are printed as JSON.
+
+Usage::
+
+ python benchmarks/bench.py                   #everything
+ python benchmarks/bench.py -k imagetonbt -r 5 -o results.json
+ python benchmarks/bench.py --estimation 2,5,10
+'''
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import minecraftmap
+from minecraftmap import constants
+from PIL import Image
+
+mappixels = 128 * 128
+
+
+def syntheticcolors(seed=0):
+    '''returns 16384 valid color codes forming blocks of terrain-like runs'''
+    rng = random.Random(seed)
+    codes = bytearray()
+    while len(codes) < mappixels:
+        codes += bytes([rng.randrange(4, len(minecraftmap.Map.allcolors))]) * rng.randrange(1, 24)
+    return codes[:mappixels]
+
+
+def syntheticmapfile(directory,seed=0):
+    '''writes a synthetic map file to directory and returns its path'''
+    m = minecraftmap.Map(eco=True)
+    m.file["data"]["colors"].value = syntheticcolors(seed)
+    p = os.path.join(directory, "map_%d.dat" % seed)
+    m.savenbt(p)
+    return p
+
+
+def syntheticimage(seed=0,size=(128,128),distinct=True):
+    '''returns an RGBA image, a noisy gradient with mostly distinct colors or, if not distinct, flat art of 32 colors'''
+    rng = random.Random(seed)
+    w, h = size
+    if distinct:
+        data = [(x*255//w ^ rng.randrange(8), y*255//h ^ rng.randrange(8), rng.randrange(256), 255)
+                for y in range(h) for x in range(w)]
+    else:
+        colors = [(rng.randrange(256), rng.randrange(256), rng.randrange(256), 255) for i in range(32)]
+        data = [colors[(x//16 + y//16*3) % 32] for y in range(h) for x in range(w)]
+    im = Image.new("RGBA", size)
+    im.putdata(data)
+    return im
+
+
+def clearcaches():
+    '''drops the memoized nearest colors so exact approximations are measured cold'''
+    for key, t in list(minecraftmap.Map.palette.tables.items()):
+        if key[0] == "index":
+            t.memo.cache_clear()
+
+
+def timed(fn,setup=None,repeat=5):
+    '''returns the seconds of repeat calls of fn, each after an untimed setup()'''
+    if setup: setup()
+    fn()
+    times = []
+    for i in range(repeat):
+        if setup: setup()
+        t = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t)
+    return times
+
+
+def result(name,times,maps=1,pixels=mappixels):
+    median = statistics.median(times)
+    return {
+        "name": name,
+        "runs": len(times),
+        "seconds_median": median,
+        "seconds_min": min(times),
+        "maps_per_second": maps / median if median else None,
+        "megapixels_per_second": pixels / 1e6 / median if median else None,
+        }
+
+
+def benchmarks(directory,estimation):
+    '''yields (name, fn, setup, maps, pixels) of every benchmark'''
+    path = syntheticmapfile(directory)
+    yield "parse.Map.__init__", lambda: minecraftmap.Map(path, eco=True), None, 1, mappixels
+    yield "parse.mapfile.readmapdata", lambda: minecraftmap.mapfile.readmapdata(path), None, 1, mappixels
+
+    m = minecraftmap.Map(path, eco=True)
+    yield "genimage.rgba", lambda: m.genimage(), None, 1, mappixels
+    yield "genimage.palettized", lambda: m.genimage(palettized=True), None, 1, mappixels
+
+    r = minecraftmap.Map(path, eco=True)
+    def dirty():
+        r.setpoint((5, 5), 8)
+    yield "genimage.incremental", lambda: r.genimage(incremental=True), dirty, 1, mappixels
+
+    yield "access.getbyte.all", lambda: [m.getbyte(i) for i in range(mappixels)], None, 1, mappixels
+    yield "access.getrect.all", lambda: m.getrect((0, 0, 128, 128)), None, 1, mappixels
+    yield "access.setrect.quarter", lambda: r.setrect((0, 0, 64, 64), bytes(64*64)), None, 1, mappixels // 4
+
+    out = os.path.join(directory, "out.dat")
+    yield "savenbt", lambda: m.savenbt(out), None, 1, mappixels
+    yield "savenbt.compresslevel1", lambda: m.savenbt(out, compresslevel=1), None, 1, mappixels
+    png = os.path.join(directory, "out.png")
+    yield "saveimagepng", lambda: m.saveimagepng(png), None, 1, mappixels
+
+    for kind, distinct in (("gradient", True), ("flat", False)):
+        q = minecraftmap.Map(eco=True)
+        im = syntheticimage(1, distinct=distinct)
+        def reset(q=q, im=im):
+            q.im = im.copy()
+            clearcaches()
+        yield "imagetonbt.exact." + kind, lambda q=q: q.imagetonbt(optimized=False), reset, 1, mappixels
+        yield "imagetonbt.optimized." + kind, lambda q=q: q.imagetonbt(optimized=True), reset, 1, mappixels
+        def uselookupdict(q=q):
+            q.uselookupdict = True
+            try:
+                q.imagetonbt(optimized=True)
+            finally:
+                del q.uselookupdict
+        yield "imagetonbt.uselookupdict." + kind, uselookupdict, reset, 1, mappixels
+        if minecraftmap.quantize.np is not None:
+            yield "imagetonbt.vectorized." + kind, lambda q=q: q.imagetonbt(optimized=False, vectorized=True), reset, 1, mappixels
+            yield "imagetonbt.floydsteinberg." + kind, lambda q=q: q.imagetonbt(dither="floydsteinberg"), reset, 1, mappixels
+            yield "imagetonbt.bayer." + kind, lambda q=q: q.imagetonbt(dither="bayer"), reset, 1, mappixels
+
+    rng = random.Random(2)
+    colors = [(rng.randrange(256), rng.randrange(256), rng.randrange(256)) for i in range(1000)]
+    a = minecraftmap.Map(eco=True)
+    yield "approximate.scan.1000colors", lambda: [a.approximate(c, lookupindex=None) for c in colors], clearcaches, 1000/mappixels, 1000
+    yield "approximate.estimationlookup.1000colors", lambda: [a.approximate(c) for c in colors], None, 1000/mappixels, 1000
+
+    for n in estimation:
+        yield "constants.genestimation.%d" % n, lambda n=n: constants.genestimation(n), None, 1, (n+1)**3
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark minecraftmap hot paths with synthetic data.")
+    parser.add_argument("-k", "--select", default=None, help="only run benchmarks whose name contains this")
+    parser.add_argument("-r", "--repeat", type=int, default=5)
+    parser.add_argument("-o", "--output", default=None, help="also write the JSON results to this file")
+    parser.add_argument("--estimation", default="2,5,10",
+                        help="comma separated n for constants.genestimation(n)")
+    args = parser.parse_args(argv)
+
+    estimation = [int(n) for n in args.estimation.split(",") if n]
+    directory = tempfile.mkdtemp(prefix="minecraftmap-bench-")
+    results = []
+    try:
+        for name, fn, setup, maps, pixels in benchmarks(directory, estimation):
+            if args.select and args.select not in name:
+                continue
+            results.append(result(name, timed(fn, setup, args.repeat), maps, pixels))
+            print("%-45s %10.6f s" % (name, results[-1]["seconds_median"]), file=sys.stderr)
+    finally:
+        shutil.rmtree(directory)
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "numpy": minecraftmap.quantize.np is not None,
+        "benchmarks": results,
+        }
+    text = json.dumps(report, indent=1)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
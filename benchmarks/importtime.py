@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+'''Measures how long "import minecraftmap" takes in fresh interpreters.
+
+Prints JSON with the median and minimum time of the whole import and of the package
+alone (after Pillow and nbt are already imported), and the heavy optional modules the
+import pulled in. With --max-ms it exits with status 1 if the package median is slower,
+so it can guard against import time regressions.
+
+Usage::
+
+ python benchmarks/importtime.py --runs 20 --max-ms 50
+'''
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+probe = """
+import sys, time
+t0 = time.perf_counter()
+import PIL.Image, PIL.ImageDraw, PIL.ImageFont, nbt.nbt
+t1 = time.perf_counter()
+import minecraftmap
+t2 = time.perf_counter()
+heavy = [m for m in ("numpy", "sqlite3", "concurrent.futures") if m in sys.modules]
+print(t2 - t0, t2 - t1, ",".join(heavy))
+"""
+
+def measure(runs):
+    '''returns a dict of import timings in milliseconds over runs fresh interpreters'''
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [root, os.environ.get("PYTHONPATH")])))
+    total, package, heavy = [], [], set()
+    for i in range(runs):
+        out = subprocess.check_output([sys.executable, "-c", probe], env=env, universal_newlines=True).split()
+        total.append(float(out[0]) * 1000)
+        package.append(float(out[1]) * 1000)
+        if len(out) > 2:
+            heavy.update(out[2].split(","))
+    return {
+        "runs": runs,
+        "total_median_ms": round(statistics.median(total), 3),
+        "total_min_ms": round(min(total), 3),
+        "package_median_ms": round(statistics.median(package), 3),
+        "package_min_ms": round(min(package), 3),
+        "heavy_modules_imported": sorted(heavy),
+        }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the import time of minecraftmap.")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--max-ms", type=float, default=None,
+                        help="fail if the median import time of the package alone exceeds this")
+    args = parser.parse_args(argv)
+    result = measure(args.runs)
+    print(json.dumps(result, indent=1))
+    if args.max_ms is not None and result["package_median_ms"] > args.max_ms:
+        print("import time regression: %.1f ms > %.1f ms" % (result["package_median_ms"], args.max_ms), file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
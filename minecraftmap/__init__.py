@@ -1,13 +1,35 @@
 from nbt import nbt
 from nbt.nbt import NBTFile, TAG_Long, TAG_Int, TAG_String, TAG_List, TAG_Compound
-from PIL import Image,ImageDraw,ImageFont
+from PIL import Image,ImageDraw,ImageFont,ImagePalette
 from os import path
-from functools import partial
+from io import BytesIO
+import importlib
+import json
 
-from . import constants
+from . import constants, instrument
+from .palette import Palette
 
 fontpath = path.join(path.dirname(__file__), "minecraftia", "Minecraftia.ttf")
 
+#imported on first attribute access, so importing minecraftmap does not load NumPy, sqlite3 etc.
+submodules = ("aio", "atlas", "batch", "catalog", "diff", "lookup", "mapfile", "metrics", "quantize", "rendercache", "tiling")
+
+def __getattr__(name):
+    if name in submodules:
+        return importlib.import_module("." + name, __name__)
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+class lazyattribute():
+    '''class attribute computed by function on first access, instances and subclasses may still override it'''
+    def __init__(self,function):
+        self.function = function
+        self.value = None
+    
+    def __get__(self,obj,objtype=None):
+        if self.value is None:
+            self.value = self.function()
+        return self.value
+
 def unpack_nbt(tag):
     """                                                                                                                                                                              
     Unpack an NBT tag into a native Python data structure.                                                                                                                           
@@ -21,6 +43,21 @@ def unpack_nbt(tag):
         return tag.value
 
 
+def bannername(name):
+    '''returns the plain text of a banner's Name, a JSON text component, or None'''
+    if not name:
+        return None
+    try:
+        component = json.loads(name)
+    except ValueError:
+        return name
+    if isinstance(component, dict):
+        return component.get("text", "") + "".join(bannername(json.dumps(e)) or "" for e in component.get("extra", []))
+    if isinstance(component, list):
+        return "".join(bannername(json.dumps(e)) or "" for e in component)
+    return str(component)
+
+
 class ColorError(Exception):
     def __init__(self,color):
         self.color = color
@@ -34,16 +71,19 @@ class Map():
         '''Map class containing nbt data and a PIL Image object, with read/write functionality. Eco means the Image object is not written to upon initialization.'''
         
         if filename:
-            self.file = nbt.NBTFile(filename)
+            with instrument.phase("parse"):
+                self.file = nbt.NBTFile(filename)
         else:
             self.file = self.gendefaultnbt()
+        #the colors tag, kept so pixel access skips the nbt compound lookups
+        self.colorstag = self.file["data"]["colors"]
         self.dimension = self.file["data"]["dimension"].value
         self.height = 128
         self.width = 128
         self.centerxz = (self.file["data"]["xCenter"].value, self.file["data"]["zCenter"].value)
         self.zoomlevel = self.file["data"]["scale"].value
         self.pixelcenterxy = (self.width/2, self.height/2)
-        self.scalemultiplier = self.zoomlevel ** 2
+        self.scalemultiplier = 2 ** self.zoomlevel
         
         try:
             self.banners = unpack_nbt(self.file["data"]["banners"])
@@ -51,14 +91,15 @@ class Map():
             self.banners = []    
         
         self.im = Image.new("RGBA",(self.width, self.height))
-        self.draw = ImageDraw.Draw(self.im)
+        #region of the nbt colors that self.im does not show yet, (x0,y0,x1,y1) or None
+        self.dirtybox = (0, 0, self.width, self.height)
         
         try:
             self.tag = self.file["data"]["tag"].value
         except:
             self.tag = {}
         
-        if constants.alphacolor != self.alphacolor:
+        if self.palette.alphacolor != self.alphacolor:
             self.gencolors()
         
         if not eco: self.genimage()
@@ -70,16 +111,39 @@ class Map():
     
     basecolors = constants.basecolors
     
-    allcolors = constants.allcolors
-    
     alphacolor = constants.alphacolor
     
+    #shared immutable Palette matching alphacolor and basecolors
+    palette = Palette.get(alphacolor, basecolors)
+    
+    allcolors = palette.allcolors
+    
     #uses estimationlookupdict if True, uses estimationlookup if False
     uselookupdict = False
     
-    allcolorsinversemap = constants.allcolorsinversemap
+    #uses the exact lookup.getcube table before any estimation table if True
+    uselookupcube = False
+    
+    #distance used to find the nearest color, one of metrics.metricnames,
+    #the lookup cube and estimation tables are only used for "rgb"
+    colormetric = "rgb"
+    
+    imagedraw = None
     
-    font = ImageFont.truetype(fontpath,8)   
+    @property
+    def draw(self):
+        '''ImageDraw for self.im, created on first use since drawing on a palettized image copies it'''
+        if self.imagedraw is None or self.imagedraw.im is not self.im.im:
+            self.imagedraw = ImageDraw.Draw(self.im)
+        return self.imagedraw
+    
+    @draw.setter
+    def draw(self,value):
+        self.imagedraw = value
+    
+    allcolorsinversemap = palette.allcolorsinversemap
+    
+    font = lazyattribute(lambda: ImageFont.truetype(fontpath,8))
     
     def gendefaultnbt(self):
         '''returns an nbt object'''
@@ -103,86 +167,314 @@ class Map():
     
     
     def gencolors(self):
-        '''sets allcolors list and allcolorsinversemap to match basecolors,
-        and updates all of them to match alphacolor'''
-        self.basecolors[0] = self.alphacolor
-        self.allcolors = []
-        self.allcolorsinversemap = {}
-        for i in range(len(self.basecolors)):
-            r = round
-            if i == 0:
-                    self.allcolors.extend([self.alphacolor]*4)
-                    self.allcolorsinversemap[self.alphacolor] = 3
-            else:
-                c = self.basecolors[i]
-                for n in range(4):
-                    m = (180,220,255,135)[n]
-                    newcolor = (r(c[0]*m/255), r(c[1]*m/255), r(c[2]*m/255))
-                    self.allcolors.append(newcolor)
-                    self.allcolorsinversemap[newcolor] = i*4 + n
-    
-    def genimage(self):
-        '''updates self.im'''
-        colordata = self.file["data"]["colors"].value
-        rgbdata = [self.allcolors[v] for v in colordata]
-        self.im.putdata(rgbdata)
-    
-    def imagetonbt(self,approximate=True,optimized=True,lookupindex=10):
+        '''sets palette, allcolors and allcolorsinversemap to match basecolors and alphacolor,
+        the Palette is shared with every map using the same colors'''
+        with instrument.phase("palette"):
+            self.palette = Palette.get(self.alphacolor, self.basecolors)
+        self.allcolors = self.palette.allcolors
+        self.allcolorsinversemap = self.palette.allcolorsinversemap
+    
+    @instrument.timed("genimage")
+    def genimage(self,palettized=False,incremental=False):
+        '''updates self.im, if palettized self.im becomes a "P" mode image sharing the nbt color bytes,
+        if incremental only the region changed through setbyte/setpoint/setpoints/fillrect is redrawn'''
+        mode = "P" if palettized else "RGBA"
+        if incremental and self.im.mode == mode and self.im.size == (self.width, self.height):
+            box = self.dirtybox
+            self.dirtybox = None
+            #a palettized image still sharing the nbt bytes is always up to date
+            if box is None or (palettized and self.im.readonly):
+                return
+            part = self.genpaletteimage().crop(box)
+            self.im.paste(part if palettized else part.convert("RGBA"), box[:2])
+            return
+        pim = self.genpaletteimage()
+        if palettized:
+            self.im = pim
+        else:
+            if self.im.mode != "RGBA" or self.im.size != (self.width, self.height):
+                self.im = Image.new("RGBA",(self.width, self.height))
+            self.im.paste(pim.convert("RGBA"))
+        self.dirtybox = None
+    
+    def markdirty(self,box):
+        '''adds box (x0,y0,x1,y1), end exclusive, to the region genimage(incremental=True) redraws'''
+        if self.dirtybox is None:
+            self.dirtybox = tuple(box)
+        else:
+            d = self.dirtybox
+            self.dirtybox = (min(d[0],box[0]), min(d[1],box[1]), max(d[2],box[2]), max(d[3],box[3]))
+    
+    def getpalettedata(self):
+        '''returns allcolors as 256 RGBA palette entries, unused codes are transparent'''
+        return self.palette.palettedata
+    
+    def genpaletteimage(self):
+        '''returns a "P" mode image wrapping the nbt color bytes without copying, with allcolors as palette'''
+        colordata = self.colorstag.value
+        pim = Image.frombuffer("P",(self.width, self.height),colordata,"raw","P",0,1)
+        #putpalette would copy the read-only mapped buffer, so the palette is installed directly
+        pim.palette = ImagePalette.raw("RGBA",self.getpalettedata())
+        pim.palette.mode = "RGBA"
+        pim.load()
+        return pim
+    
+    @instrument.timed("quantize")
+    def imagetonbt(self,approximate=True,optimized=True,lookupindex=10,vectorized=False,dither=None):
         '''updates self.file to match self.im, approximations work but take very long, 
-        optimization with constants.estimationlookup[lookupindex] is fast but imperfect'''
+        optimization with constants.estimationlookup[lookupindex] is fast but imperfect,
+        vectorized quantizes the whole image at once with NumPy and gives the same result,
+        dither is None, "floydsteinberg" or "bayer" and also uses NumPy. The whole map is marked dirty
+        since self.im still holds the unquantized colors, genimage(incremental=True) redraws it'''
+        from . import quantize
+        if dither:
+            q = self.palette.getquantizer()
+            self.setcolors(q.dither(quantize.imagepixels(self.im), dither, metric=self.colormetric))
+            return
+        if approximate and vectorized:
+            if self.uselookupcube and self.colormetric == "rgb":
+                cube = self.getlookupcube()
+                self.setcolors(cube.quantize(quantize.imagearray(self.im)))
+                return
+            q = self.palette.getquantizer()
+            usetable = optimized and lookupindex in constants.estimationlookup
+            colordata = q.quantize(quantize.imagearray(self.im),
+                                   lookupindex=lookupindex if usetable else None,
+                                   uselookupdict=self.uselookupdict,
+                                   metric=self.colormetric)
+            self.setcolors(colordata)
+            return
+        if self.im.mode == "P" and self.im.getpalette("RGBA") == list(self.getpalettedata()):
+            self.setcolors(self.im.tobytes())
+            return
         rgbdata = self.im.getdata()
         try:
             if approximate:
-                if optimized and lookupindex in constants.estimationlookup:
-                    colordata = bytearray([self.approximate(c,lookupindex=lookupindex) for c in rgbdata])
-                else:
-                    colordata = bytearray([self.approximate(c) for c in rgbdata])
+                if not (optimized and lookupindex in constants.estimationlookup):
+                    lookupindex = None
+                #each distinct color is approximated once
+                colors = self.im.getcolors(self.width*self.height)
+                codes = dict((c, self.approximate(c,lookupindex=lookupindex)) for n, c in colors)
+                colordata = bytearray(map(codes.__getitem__, rgbdata))
             else:
                 colordata = bytearray([self.allcolorsinversemap[c] for c in rgbdata])
             
         except KeyError as e:
             raise ColorError(e.args[0])
-        self.file["data"]["colors"].value = colordata
+        self.setcolors(colordata)
     
+    @instrument.timed("save")
     def saveimagebmp(self,filename):
         '''Saves self.im as a bmp'''
         self.im.save(filename)
     
+    @instrument.timed("save")
     def saveimagepng(self,filename):
         '''Saves self.im as png'''
         self.im.save(filename,"PNG")
     
+    @instrument.timed("save")
     def saveimagejpg(self,filename):
         '''Saves self.im as jpg'''
         self.im.save(filename,"JPEG",quality=100,subsampling=0)
     
-    def savenbt(self,filename=None):
-        '''Saves nbt data to original file or to specified filename'''
-        if filename or self.file.filename:
-            self.file.write_file(filename)
+    @instrument.timed("save")
+    def imagebytes(self,format="png"):
+        '''Returns self.im encoded as "png", "jpg" or "bmp" bytes, jpg without transparency'''
+        buf = BytesIO()
+        if format == "png":
+            self.im.save(buf,"PNG")
+        elif format == "jpg":
+            self.im.convert("RGB").save(buf,"JPEG",quality=100,subsampling=0)
+        elif format == "bmp":
+            self.im.save(buf,"BMP")
+        else:
+            raise ValueError("unknown format: " + str(format))
+        return buf.getvalue()
+    
+    @instrument.timed("save")
+    def savenbt(self,filename=None,compresslevel=9,atomic=True):
+        '''Saves nbt data to original file or to specified filename,
+        compresslevel 1 is fastest, atomic replaces the file only once it is completely written'''
+        if filename:
+            self.file.filename = filename
+        if self.file.filename:
+            from . import mapfile
+            mapfile.writenbt(self.file, self.file.filename, compresslevel, atomic)
 
+    def upscale(self,factor):
+        '''returns a "P" mode image of the nbt colors enlarged factor times by nearest neighbour,
+        the color codes are repeated before any RGBA expansion'''
+        pim = self.genpaletteimage()
+        if factor == 1:
+            return pim.copy()
+        return pim.resize((self.width*factor, self.height*factor), Image.NEAREST)
+    
     def rescale(self, num=1):
-        self.im = self.im.resize((self.height * num * 2 ** self.zoomlevel , self.width * num * 2 ** self.zoomlevel))
+        '''Enlarges self.im to num pixels per block by nearest neighbour, a palettized self.im stays palettized'''
+        factor = num * self.scalemultiplier
+        self.im = self.im.resize((self.width * factor, self.height * factor), Image.NEAREST)
+    
+    def compose(self,num=1,banners=True,texts=(),palettized=False,font=None,markersize=None):
+        '''Returns a new image of the nbt colors at num pixels per block with the banner markers and names
+        and texts, an iterable of (xz, text) or (xz, text, fill) at block coordinates, drawn once at that size.
+        The colors are upscaled as color codes, if palettized the result stays a "P" image and fills are
+        color codes, otherwise it is RGBA. font defaults to self.font.'''
+        factor = num * self.scalemultiplier
+        im = self.upscale(factor)
+        if not palettized:
+            im = im.convert("RGBA")
+        draw = ImageDraw.Draw(im)
+        font = font or self.font
+        markersize = markersize or max(4, 2*num)
+        def color(rgb):
+            return self.approximate(rgb) if palettized else rgb
+        def topixel(xz):
+            return ((xz[0] - self.centerxz[0]) * num + im.size[0] // 2,
+                    (xz[1] - self.centerxz[1]) * num + im.size[1] // 2)
+        def label(xy,text,fill):
+            width = draw.textlength(text, font=font)
+            draw.text((xy[0] - width // 2, xy[1]), text, fill=fill, font=font)
+        if banners:
+            for banner in self.banners:
+                pos = banner.get("Pos", {})
+                x, y = topixel((pos.get("X", 0), pos.get("Z", 0)))
+                fill = color(constants.dyecolors.get(banner.get("Color"), constants.dyecolors["white"]))
+                outline = color((0, 0, 0))
+                draw.rectangle((x - markersize//2, y - markersize, x + markersize//2, y), fill=fill, outline=outline)
+                name = bannername(banner.get("Name"))
+                if name:
+                    label((x, y + 1), name, color((255, 255, 255)))
+        for overlay in texts:
+            fill = overlay[2] if len(overlay) > 2 else color((255, 255, 255))
+            label(topixel(overlay[0]), overlay[1], fill)
+        return im
     
     
     def getbyte(self,index):
         '''Gets nbt image byte at index, returns None if out of range'''
-        return self.file["data"]["colors"].value[index]
+        return self.colorstag.value[index]
     
     def setbyte(self,index,byte):
         '''Sets nbt image byte at index'''
-        self.file["data"]["colors"].value[index] = byte
+        if not 0 <= index < self.width*self.height:
+            raise IndexError("index %r is outside the map" % (index,))
+        self.colorstag.value[index] = byte
+        x, y = index % self.width, index // self.width
+        self.markdirty((x, y, x+1, y+1))
     
     def getpoint(self,xy):
         '''Gets nbt image byte at specific (x,y)'''
         index = xy[0] + xy[1]*self.width
-        try: return self.file["data"]["colors"].value[index]
+        try: return self.colorstag.value[index]
         except IndexError: return None
     
     def setpoint(self,xy,value):
-        '''Sets nbt image byte at specific (x,y)'''
+        '''Sets nbt image byte at specific (x,y), raises ValueError if it is outside the map'''
+        self.checkpoint(xy)
         index = xy[0] + xy[1]*self.width
-        self.file["data"]["colors"].value[index] = value
+        self.colorstag.value[index] = value
+        self.markdirty((xy[0], xy[1], xy[0]+1, xy[1]+1))
+    
+    def setpoints(self,xys,values):
+        '''Sets nbt image bytes at many (x,y), values is one byte for all points or one byte per point,
+        raises ValueError if there are more or fewer values than points or a point is outside the map'''
+        colordata = self.colorstag.value
+        w = self.width
+        xys = list(xys)
+        if not xys:
+            return
+        xs = [xy[0] for xy in xys]
+        ys = [xy[1] for xy in xys]
+        box = (min(xs), min(ys), max(xs)+1, max(ys)+1)
+        if not (0 <= box[0] and box[2] <= self.width and 0 <= box[1] and box[3] <= self.height):
+            raise ValueError("points %r reach outside the map" % (box,))
+        if isinstance(values, int):
+            for x, y in xys:
+                colordata[x + y*w] = values
+        else:
+            values = list(values)
+            if len(values) != len(xys):
+                raise ValueError("got %d values for %d points" % (len(values), len(xys)))
+            for (x, y), v in zip(xys, values):
+                colordata[x + y*w] = v
+        self.markdirty(box)
+    
+    def fillrect(self,box,value):
+        '''Sets every nbt image byte in box (x0,y0,x1,y1), end exclusive, to value'''
+        x0, y0, x1, y1 = self.checkbox(box)
+        if x1 == x0 or y1 == y0:
+            return
+        colordata = self.colorstag.value
+        row = bytes([value]) * (x1 - x0)
+        for y in range(y0, y1):
+            colordata[y*self.width + x0 : y*self.width + x1] = row
+        self.markdirty((x0, y0, x1, y1))
+    
+    @property
+    def colors(self):
+        '''the nbt color bytearray, height rows of width color codes'''
+        return self.colorstag.value
+    
+    def setcolors(self,data):
+        '''Replaces all nbt image bytes with the width*height bytes of a buffer, in place so views stay valid'''
+        colordata = self.colorstag.value
+        if len(memoryview(data).cast("B")) != self.width*self.height:
+            raise ValueError("expected %d color bytes" % (self.width*self.height))
+        colordata[:] = memoryview(data).cast("B")
+        #a palettized self.im from genimage shares these bytes and is never stale
+        if not (self.im.mode == "P" and self.im.readonly):
+            self.markdirty((0, 0, self.width, self.height))
+    
+    def colorview(self):
+        '''Returns a writable (height, width) memoryview of the nbt image bytes without copying,
+        call markdirty or genimage after writing through it'''
+        return memoryview(self.colorstag.value).cast("B", (self.height, self.width))
+    
+    def colorarray(self):
+        '''Returns a writable (height, width) NumPy uint8 array sharing the nbt image bytes,
+        call markdirty or genimage after writing through it'''
+        from . import quantize
+        quantize.requirenumpy()
+        return quantize.np.frombuffer(self.colorstag.value, dtype=quantize.np.uint8).reshape(self.height, self.width)
+    
+    def getrect(self,box):
+        '''Gets the nbt image bytes in box (x0,y0,x1,y1), end exclusive, row by row'''
+        x0, y0, x1, y1 = self.checkbox(box)
+        colordata = self.colorstag.value
+        w = self.width
+        if x0 == 0 and x1 == w:
+            return colordata[y0*w : y1*w]
+        return bytearray().join(colordata[y*w + x0 : y*w + x1] for y in range(y0, y1))
+    
+    def setrect(self,box,data):
+        '''Sets the nbt image bytes in box (x0,y0,x1,y1), end exclusive, from a buffer of its rows'''
+        x0, y0, x1, y1 = self.checkbox(box)
+        data = memoryview(data).cast("B")
+        n = x1 - x0
+        if len(data) != n * (y1 - y0):
+            raise ValueError("expected %d bytes for box %r" % (n * (y1 - y0), tuple(box)))
+        colordata = self.colorstag.value
+        w = self.width
+        if x0 == 0 and x1 == w:
+            colordata[y0*w : y1*w] = data
+        else:
+            for i, y in enumerate(range(y0, y1)):
+                colordata[y*w + x0 : y*w + x1] = data[i*n : (i+1)*n]
+        if n and y1 > y0:
+            self.markdirty((x0, y0, x1, y1))
+    
+    def checkpoint(self,xy):
+        '''raises ValueError if xy is not inside the map'''
+        if not (0 <= xy[0] < self.width and 0 <= xy[1] < self.height):
+            raise ValueError("point %r is outside the map" % (tuple(xy),))
+    
+    def checkbox(self,box):
+        '''returns box as a tuple, raises ValueError if it is not inside the map'''
+        x0, y0, x1, y1 = box
+        if not (0 <= x0 <= x1 <= self.width and 0 <= y0 <= y1 <= self.height):
+            raise ValueError("box %r is outside the map" % (tuple(box),))
+        return x0, y0, x1, y1
     
     def topixel(self,xz):
         '''converts coords to pixels where x:east and z:south'''
@@ -200,6 +492,14 @@ class Map():
         blockxz = (blockshiftxz[0]+self.centerxz[0],blockshiftxz[1]+self.centerxz[1])
         return blockxz
     
+    def getlookupcube(self):
+        '''returns the exact rgb lookup cube for allcolors, built or loaded from the disk cache once'''
+        return self.palette.getlookupcube()
+    
+    def getpaletteindex(self):
+        '''returns the metrics.PaletteIndex for allcolors and colormetric, memoizing nearest colors'''
+        return self.palette.getindex(self.colormetric)
+    
     def colordifference(self,testcolor,comparecolor):
         '''returns rgb distance squared'''
         d = ((testcolor[0]-comparecolor[0])**2+
@@ -211,12 +511,19 @@ class Map():
         '''returns best minecraft color code from rgb,
         lookupindex refers to constants.estimationlookup and can be None'''
         try:
-            return self.allcolorsinversemap[color]
+            code = self.allcolorsinversemap[color]
+            if instrument.enabled: instrument.count("approximate.exact")
+            return code
         except KeyError:
-            if self.uselookupdict and lookupindex in constants.estimationlookupdict:
+            if self.colormetric == "rgb" and self.uselookupcube:
+                if instrument.enabled: instrument.count("approximate.cube")
+                return self.getlookupcube()[color]
+            elif self.colormetric == "rgb" and self.uselookupdict and lookupindex in constants.estimationlookupdict:
+                if instrument.enabled: instrument.count("approximate.estimation")
                 return constants.estimationlookupdict[lookupindex][(color[0]*lookupindex//255,color[1]*lookupindex//255,color[2]*lookupindex//255)]
-            elif not self.uselookupdict and lookupindex in constants.estimationlookup:
+            elif self.colormetric == "rgb" and not self.uselookupdict and lookupindex in constants.estimationlookup:
+                if instrument.enabled: instrument.count("approximate.estimation")
                 return constants.estimationlookup[lookupindex][color[0]*lookupindex//255][color[1]*lookupindex//255][color[2]*lookupindex//255]
             else:
-                color = min(self.allcolors,key=partial(self.colordifference,color))
-                return self.allcolorsinversemap[color]
+                if instrument.enabled: instrument.count("approximate.scan")
+                return self.getpaletteindex().nearest(color)
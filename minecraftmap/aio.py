@@ -0,0 +1,98 @@
+'''Asyncio counterparts of loading, rendering and saving maps.
+
+The blocking file I/O and CPU work runs in an executor, by default the event loop's
+default thread pool, and at most limit calls run at once per event loop so a burst of
+requests queues up instead of stalling the loop or flooding the executor. Rendering
+returns the encoded image bytes directly.
+
+Usage::
+
+ from concurrent.futures import ProcessPoolExecutor
+ minecraftmap.aio.executor = ProcessPoolExecutor(4)
+ minecraftmap.aio.limit = 8
+
+ async def tile(request):
+    png = await minecraftmap.aio.render(mappath(request))
+    ...
+
+ m = await minecraftmap.aio.load(filepath)
+ await minecraftmap.aio.savenbt(m,"map_1.dat")
+
+render, with a filename, works with thread and process pools alike, the Map objects
+taken and returned by load, renderimage, saveimage and savenbt have to stay in one
+process, so those always use a thread pool (threadexecutor, or the loop's default).
+'''
+
+import asyncio
+import os
+import weakref
+from functools import partial
+
+#executor render uses, None is the running loop's default executor
+executor = None
+#executor of the functions passing Map objects, None is the running loop's default executor
+threadexecutor = None
+#calls running in the executors at once, per event loop, calls already waiting keep the old limit
+limit = os.cpu_count() or 1
+
+semaphores = weakref.WeakKeyDictionary()
+
+
+def semaphore(loop):
+    '''returns the semaphore capping concurrent calls in loop, a new one once limit changed'''
+    s = semaphores.get(loop)
+    if s is None or s[0] != limit:
+        s = semaphores[loop] = (limit, asyncio.Semaphore(limit))
+    return s[1]
+
+
+async def run(function,*args,pool=None,**kwargs):
+    '''runs function(*args, **kwargs) in pool, None is the loop's default executor, at most limit at once'''
+    loop = asyncio.get_running_loop()
+    async with semaphore(loop):
+        return await loop.run_in_executor(pool, partial(function, *args, **kwargs))
+
+
+def renderbytes(source,format="png",palettized=True):
+    '''loads the map file source and returns its image encoded as "png", "jpg" or "bmp" bytes'''
+    from . import Map
+    m = Map(source, eco=True)
+    m.genimage(palettized=palettized)
+    return m.imagebytes(format)
+
+
+async def render(source,format="png",palettized=True):
+    '''returns the image of the map file source as encoded bytes, see renderbytes'''
+    return await run(renderbytes, source, format, palettized, pool=executor)
+
+
+async def load(filename,eco=False):
+    '''returns Map(filename, eco) loaded in the thread executor'''
+    from . import Map
+    return await run(Map, filename, eco, pool=threadexecutor)
+
+
+async def renderimage(m,format="png",palettized=False):
+    '''updates m.im with genimage and returns it as encoded bytes'''
+    def work():
+        m.genimage(palettized=palettized)
+        return m.imagebytes(format)
+    return await run(work, pool=threadexecutor)
+
+
+async def saveimage(m,filename,format="png"):
+    '''writes m.im to filename as "png", "jpg" or "bmp"'''
+    save = {"png": m.saveimagepng, "jpg": m.saveimagejpg, "bmp": m.saveimagebmp}
+    if format not in save:
+        raise ValueError("unknown format: " + str(format))
+    await run(save[format], filename, pool=threadexecutor)
+
+
+async def savenbt(m,filename=None,compresslevel=9,atomic=True):
+    '''Map.savenbt in the thread executor'''
+    await run(m.savenbt, filename, compresslevel, atomic, pool=threadexecutor)
+
+
+async def renderall(sources,format="png",palettized=True):
+    '''returns the encoded images of many map files, in order, rendered concurrently up to limit'''
+    return await asyncio.gather(*(render(s, format, palettized) for s in sources))
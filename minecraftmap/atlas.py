@@ -0,0 +1,145 @@
+'''Stitching many maps into one world atlas, written as tiles.
+
+Maps are placed by their world coordinates (Map.tocoord) and painted from the coarsest
+scale to the finest, so where maps overlap the more detailed one wins and transparent
+(unexplored) pixels let coarser maps show through. Only one tile and a bounded number
+of map images are held in memory at a time.
+
+Usage::
+
+ atlas = minecraftmap.atlas.Atlas(minecraftmap.batch.findmaps("saves/Test World/data"))
+ atlas.save("atlas/")   #atlas/tile_<column>_<row>.png and atlas/atlas.json
+'''
+
+import json
+import os
+from collections import OrderedDict, namedtuple
+
+from PIL import Image
+
+AtlasEntry = namedtuple("AtlasEntry", ["path", "scale", "left", "top", "size"])
+
+
+def mapentry(path):
+    '''returns the AtlasEntry and dimension of a map file, left/top/size are in blocks'''
+    from . import Map
+    m = Map(path, eco=True)
+    left, top = m.tocoord((0, 0))
+    return AtlasEntry(path, m.zoomlevel, int(left), int(top), m.width * m.scalemultiplier), m.dimension
+
+
+class Atlas():
+    def __init__(self,paths,dimension=0,blocksperpixel=None,tilesize=1024,cachesize=256):
+        '''Indexes the maps of dimension among paths. blocksperpixel defaults to the
+        resolution of the most detailed map, tilesize is the tile width and height in pixels'''
+        self.entries = []
+        for p in paths:
+            entry, d = mapentry(p)
+            if d == dimension:
+                self.entries.append(entry)
+        #coarse maps first, so finer ones are painted over them
+        self.entries.sort(key=lambda e: (-e.scale, e.path))
+        self.dimension = dimension
+        self.tilesize = tilesize
+        self.cachesize = cachesize
+        self.images = OrderedDict()
+        if not self.entries:
+            self.blocksperpixel = blocksperpixel or 1
+            self.originxz = (0, 0)
+            self.width = self.height = 0
+            self.columns = self.rows = 0
+            self.tiles = {}
+            return
+        self.blocksperpixel = blocksperpixel or min(e.size for e in self.entries) // 128
+        b = self.blocksperpixel
+        left = min(e.left for e in self.entries)
+        top = min(e.top for e in self.entries)
+        right = max(e.left + e.size for e in self.entries)
+        bottom = max(e.top + e.size for e in self.entries)
+        self.originxz = (left, top)
+        self.width = -(-(right - left) // b)
+        self.height = -(-(bottom - top) // b)
+        self.columns = -(-self.width // tilesize)
+        self.rows = -(-self.height // tilesize)
+        #maps overlapping each tile, in painting order
+        self.tiles = {}
+        span = tilesize * b
+        for e in self.entries:
+            for row in range(int(e.top - top) // span, int(e.top + e.size - top - 1) // span + 1):
+                for col in range(int(e.left - left) // span, int(e.left + e.size - left - 1) // span + 1):
+                    self.tiles.setdefault((col, row), []).append(e)
+
+    def toblock(self,xy):
+        '''converts atlas pixels to block coords, returns (x,z)'''
+        return (self.originxz[0] + xy[0]*self.blocksperpixel, self.originxz[1] + xy[1]*self.blocksperpixel)
+
+    def topixel(self,xz):
+        '''converts block coords to atlas pixels'''
+        return ((xz[0] - self.originxz[0]) // self.blocksperpixel, (xz[1] - self.originxz[1]) // self.blocksperpixel)
+
+    def mapimage(self,path):
+        '''returns the RGBA image of a map file, keeping the last cachesize images'''
+        im = self.images.get(path)
+        if im is None:
+            from . import Map
+            m = Map(path, eco=True)
+            im = m.genpaletteimage().convert("RGBA")
+            self.images[path] = im
+            if len(self.images) > self.cachesize:
+                self.images.popitem(last=False)
+        else:
+            self.images.move_to_end(path)
+        return im
+
+    def tile(self,column,row):
+        '''returns the RGBA image of one tile, or None if no map overlaps it'''
+        entries = self.tiles.get((column, row))
+        if not entries:
+            return None
+        t, b = self.tilesize, self.blocksperpixel
+        x0, z0 = self.toblock((column*t, row*t))
+        im = Image.new("RGBA", (t, t))
+        for e in entries:
+            scale = e.size // 128
+            #overlap of tile and map in atlas pixels relative to the tile
+            px0 = max(0, -(-(e.left - x0) // b))
+            pz0 = max(0, -(-(e.top - z0) // b))
+            px1 = min(t, (e.left + e.size - x0) // b)
+            pz1 = min(t, (e.top + e.size - z0) // b)
+            if px1 <= px0 or pz1 <= pz0:
+                continue
+            box = ((x0 + px0*b - e.left) / scale, (z0 + pz0*b - e.top) / scale,
+                   (x0 + px1*b - e.left) / scale, (z0 + pz1*b - e.top) / scale)
+            part = self.mapimage(e.path).resize((int(px1 - px0), int(pz1 - pz0)), Image.NEAREST, box=box)
+            im.paste(part, (int(px0), int(pz0)), part)
+        return im
+
+    def save(self,outdir,format="png"):
+        '''writes every non-empty tile to outdir/tile_<column>_<row>.<format> and
+        the atlas layout to outdir/atlas.json, returns the tile paths'''
+        os.makedirs(outdir, exist_ok=True)
+        written = []
+        tiles = []
+        for row in range(self.rows):
+            for col in range(self.columns):
+                im = self.tile(col, row)
+                if im is None:
+                    continue
+                p = os.path.join(outdir, "tile_%d_%d.%s" % (col, row, format))
+                im.save(p)
+                written.append(p)
+                tiles.append([col, row])
+        layout = {
+            "dimension": self.dimension,
+            "origin": list(self.originxz),
+            "blocksperpixel": self.blocksperpixel,
+            "tilesize": self.tilesize,
+            "width": self.width,
+            "height": self.height,
+            "columns": self.columns,
+            "rows": self.rows,
+            "tiles": tiles,
+            }
+        with open(os.path.join(outdir, "atlas.json"), "w") as f:
+            json.dump(layout, f, indent=1)
+        return written
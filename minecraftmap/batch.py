@@ -0,0 +1,151 @@
+'''Batch rendering of a world's map_*.dat files through a process pool.
+
+Usage::
+
+ minecraftmap-render "saves/Test World/data" renders/ --format png --workers 8
+'''
+
+import argparse
+import json
+import os
+import re
+import sys
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from . import instrument
+
+mapfilepattern = re.compile(r"^map_(\d+)\.dat$")
+
+formats = {"png": "PNG", "jpg": "JPEG", "bmp": "BMP"}
+
+#stats is the instrument snapshot of a file rendered in a worker process while instrumentation is enabled
+RenderResult = namedtuple("RenderResult", ["source", "target", "error", "stats"], defaults=(None,))
+
+
+def findmaps(directory):
+    '''returns the paths of all map_<id>.dat files in directory, sorted by id'''
+    found = []
+    for name in os.listdir(directory):
+        match = mapfilepattern.match(name)
+        if match:
+            found.append((int(match.group(1)), os.path.join(directory, name)))
+    return [p for i, p in sorted(found)]
+
+
+def targetpath(source,outdir,format="png"):
+    '''returns the output path of a map file, outdir/map_<id>.<format>'''
+    name = os.path.splitext(os.path.basename(source))[0]
+    return os.path.join(outdir, name + "." + format)
+
+
+def renderfile(source,target,format="png",instrumented=False,cachedir=None):
+    '''renders one map file to an image file, returns a RenderResult with the error message if it failed,
+    instrumented collects the instrument statistics of this file alone into RenderResult.stats,
+    with cachedir maps whose colors did not change are copied from the rendercache there'''
+    from . import Map
+    if instrumented:
+        instrument.reset()
+        instrument.enable()
+    error = None
+    try:
+        with instrument.phase("render"):
+            if cachedir:
+                from . import rendercache
+                image = rendercache.getcache(cachedir).render(source, format)
+                with instrument.phase("save"), open(target, "wb") as f:
+                    f.write(image)
+            else:
+                m = Map(source, eco=True)
+                m.genimage(palettized=True)
+                im = m.im
+                if format == "jpg":
+                    im = im.convert("RGB")
+                with instrument.phase("save"):
+                    im.save(target, formats[format])
+    except Exception as e:
+        error = "%s: %s" % (type(e).__name__, e)
+    return RenderResult(source, target, error, finishstats(instrumented))
+
+
+def finishstats(instrumented):
+    '''returns the statistics renderfile collected and stops collecting, None if not instrumented'''
+    if not instrumented:
+        return None
+    stats = instrument.snapshot()
+    instrument.disable()
+    instrument.reset()
+    return stats
+
+
+def renderfiles(sources,outdir,format="png",workers=None,backlog=None,cachedir=None):
+    '''renders map files into outdir with a process pool, yielding a RenderResult per file in input order.
+    At most backlog files (default 4 per worker) are in flight, so memory stays bounded for any number of files.
+    workers=0 renders in this process. While instrumentation is enabled the statistics of the workers
+    are merged into this process. cachedir is a rendercache directory, see renderfile.'''
+    if format not in formats:
+        raise ValueError("unknown format: " + str(format))
+    os.makedirs(outdir, exist_ok=True)
+    jobs = ((source, targetpath(source, outdir, format), format) for source in sources)
+    if workers == 0:
+        for job in jobs:
+            yield renderfile(*job, cachedir=cachedir)
+        return
+    workers = workers or os.cpu_count() or 1
+    backlog = backlog or 4 * workers
+    instrumented = instrument.enabled
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for job in jobs:
+            pending.append(executor.submit(renderfile, *job, instrumented, cachedir))
+            if len(pending) >= backlog:
+                yield collected(pending.popleft().result())
+        while pending:
+            yield collected(pending.popleft().result())
+
+
+def collected(result):
+    '''merges the statistics a worker attached to result into this process, returns result'''
+    if result.stats:
+        instrument.merge(result.stats)
+    return result
+
+
+def renderfolder(directory,outdir,format="png",workers=None,backlog=None,cachedir=None):
+    '''renders every map_*.dat file of a world's data directory, see renderfiles'''
+    return renderfiles(findmaps(directory), outdir, format, workers, backlog, cachedir)
+
+
+def main(argv=None):
+    '''console entry point, returns 1 if any file failed and 0 otherwise'''
+    parser = argparse.ArgumentParser(prog="minecraftmap-render",
+                                     description="Render every map_*.dat file of a world's data directory.")
+    parser.add_argument("directory", help="world data directory containing map_*.dat files")
+    parser.add_argument("outdir", help="directory the images are written to")
+    parser.add_argument("-f", "--format", choices=sorted(formats), default="png")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="worker processes, defaults to the cpu count, 0 renders in-process")
+    parser.add_argument("-q", "--quiet", action="store_true", help="only report failures")
+    parser.add_argument("--cache", default=None, metavar="DIR",
+                        help="keep renders in this directory and reuse them for maps whose colors did not change")
+    parser.add_argument("--stats", action="store_true",
+                        help="print per phase timings and lookup counts as JSON to stderr at the end")
+    args = parser.parse_args(argv)
+
+    if args.stats:
+        instrument.reset()
+        instrument.enable()
+    failed = 0
+    for result in renderfolder(args.directory, args.outdir, args.format, args.workers, cachedir=args.cache):
+        if result.error:
+            failed += 1
+            print("%s: %s" % (result.source, result.error), file=sys.stderr)
+        elif not args.quiet:
+            print(result.target)
+    if args.stats:
+        print(json.dumps(instrument.snapshot(), indent=1), file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
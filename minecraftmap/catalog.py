@@ -0,0 +1,158 @@
+'''Persistent catalog of the maps of a world, for fast spatial queries.
+
+Stores id, dimension, centre, scale, file mtime and a hash of the color bytes of every
+map in an SQLite database, with an R-tree over the block area each map covers (a plain
+index is used if SQLite lacks the R-tree module). update() only rereads files whose
+mtime or size changed.
+
+Usage::
+
+ with minecraftmap.catalog.Catalog("maps.sqlite") as cat:
+    cat.update("saves/Test World/data")
+    for entry in cat.covering((100,-250),dimension=0,minscale=2):
+       print(entry.path, entry.scale)
+'''
+
+import hashlib
+import os
+import sqlite3
+from collections import namedtuple
+from contextlib import contextmanager
+
+from . import batch
+from . import mapfile
+
+CatalogEntry = namedtuple("CatalogEntry", ["id", "path", "dimension", "xcenter", "zcenter", "scale",
+                                           "mtime", "size", "hash", "left", "top", "right", "bottom"])
+
+columns = ", ".join(CatalogEntry._fields)
+
+
+def mapbounds(xcenter,zcenter,scale,width=128,height=128):
+    '''returns the (left, top, right, bottom) blocks a map covers, right and bottom exclusive,
+    the same as Map.tocoord((0,0)) and Map.tocoord((width,height))'''
+    m = 2 ** scale
+    return (xcenter - width//2*m, zcenter - height//2*m, xcenter + (width - width//2)*m, zcenter + (height - height//2)*m)
+
+
+def colorhash(colors):
+    '''returns the content hash of a map's color bytes'''
+    return hashlib.blake2b(colors, digest_size=16).hexdigest()
+
+
+class Catalog():
+    def __init__(self,dbpath):
+        '''Opens or creates the catalog database at dbpath (":memory:" for a temporary one)'''
+        self.db = sqlite3.connect(dbpath)
+        self.db.execute("CREATE TABLE IF NOT EXISTS maps (id INTEGER, path TEXT UNIQUE, dimension, "
+                        "xcenter INTEGER, zcenter INTEGER, scale INTEGER, mtime REAL, size INTEGER, hash TEXT, "
+                        "left INTEGER, top INTEGER, right INTEGER, bottom INTEGER)")
+        try:
+            self.db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS mapareas USING rtree(rowid, left, right, top, bottom)")
+            self.rtree = True
+        except sqlite3.OperationalError:
+            self.db.execute("CREATE INDEX IF NOT EXISTS mapsarea ON maps (left, top)")
+            self.rtree = False
+        self.db.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc):
+        self.close()
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+    @contextmanager
+    def transaction(self):
+        '''commits the changes made inside on success and rolls them back on error,
+        inside an outer transaction they are left to it'''
+        if self.db.in_transaction:
+            yield
+            return
+        self.db.execute("BEGIN")
+        with self.db:
+            yield
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM maps").fetchone()[0]
+
+    def add(self,path,stat=None):
+        '''reads one map file and stores or replaces its entry'''
+        stat = stat or os.stat(path)
+        data = mapfile.readmapdata(path)
+        match = batch.mapfilepattern.match(os.path.basename(path))
+        bounds = mapbounds(data["xCenter"], data["zCenter"], data["scale"])
+        row = (int(match.group(1)) if match else None, path, data["dimension"], data["xCenter"], data["zCenter"],
+               data["scale"], stat.st_mtime, stat.st_size, colorhash(data["colors"])) + bounds
+        with self.transaction():
+            self.remove(path)
+            cursor = self.db.execute("INSERT INTO maps (%s) VALUES (%s)" % (columns, ", ".join("?" * len(row))), row)
+            if self.rtree:
+                self.db.execute("INSERT INTO mapareas VALUES (?, ?, ?, ?, ?)",
+                                (cursor.lastrowid, bounds[0], bounds[2], bounds[1], bounds[3]))
+
+    def remove(self,path):
+        '''removes the entry of a map file'''
+        with self.transaction():
+            if self.rtree:
+                self.db.execute("DELETE FROM mapareas WHERE rowid IN (SELECT rowid FROM maps WHERE path = ?)", (path,))
+            self.db.execute("DELETE FROM maps WHERE path = ?", (path,))
+
+    def update(self,directory):
+        '''brings the catalog up to date with the map_*.dat files of a world's data directory,
+        returns a dict counting added, updated, removed and unchanged files and a list of (path, error) failures'''
+        result = {"added": 0, "updated": 0, "removed": 0, "unchanged": 0, "failed": []}
+        prefix = os.path.join(directory, "")
+        known = dict((r[0], (r[1], r[2])) for r in self.db.execute(
+            "SELECT path, mtime, size FROM maps WHERE substr(path, 1, ?) = ?", (len(prefix), prefix)))
+        with self.transaction():
+            for path in batch.findmaps(directory):
+                stat = os.stat(path)
+                old = known.pop(path, None)
+                if old == (stat.st_mtime, stat.st_size):
+                    result["unchanged"] += 1
+                    continue
+                try:
+                    self.add(path, stat)
+                except (OSError, KeyError, mapfile.NBTFormatError) as e:
+                    result["failed"].append((path, "%s: %s" % (type(e).__name__, e)))
+                    continue
+                result["updated" if old else "added"] += 1
+            for path in known:
+                self.remove(path)
+                result["removed"] += 1
+        return result
+
+    def query(self,rect=None,dimension=None,minscale=None,maxscale=None):
+        '''returns the CatalogEntries of maps overlapping rect (x0,z0,x1,z1) in blocks, end exclusive,
+        optionally only of one dimension and a range of scales, ordered by scale and id'''
+        where, args = [], []
+        if rect is not None:
+            x0, z0, x1, z1 = rect
+            if self.rtree:
+                #the r-tree stores rounded 32 bit floats, so the exact columns are checked too
+                where.append("rowid IN (SELECT rowid FROM mapareas WHERE left < ? AND right > ? AND top < ? AND bottom > ?)")
+                args += [x1, x0, z1, z0]
+            where.append("left < ? AND right > ? AND top < ? AND bottom > ?")
+            args += [x1, x0, z1, z0]
+        if dimension is not None:
+            where.append("dimension = ?")
+            args.append(dimension)
+        if minscale is not None:
+            where.append("scale >= ?")
+            args.append(minscale)
+        if maxscale is not None:
+            where.append("scale <= ?")
+            args.append(maxscale)
+        sql = "SELECT %s FROM maps" % columns
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY scale, id, path"
+        return [CatalogEntry(*r) for r in self.db.execute(sql, args)]
+
+    def covering(self,xz,dimension=None,minscale=None,maxscale=None):
+        '''returns the CatalogEntries of maps covering block (x, z)'''
+        return self.query((xz[0], xz[1], xz[0]+1, xz[1]+1), dimension, minscale, maxscale)
@@ -1,4 +1,6 @@
 from functools import partial
+from os import path
+import hashlib
 import math
 
 def multiplyColor(colorTuple, multiplier):
@@ -245,7 +247,35 @@ estimationlookup = {
     }
 
 
-estimationlookupdict = {}
+#rgb of the dye colors banners use for their map markers, by the "Color" name in the map nbt
+dyecolors = {"white": (249, 255, 254), "orange": (249, 128, 29), "magenta": (199, 78, 189),
+    "light_blue": (58, 179, 218), "yellow": (254, 216, 61), "lime": (128, 199, 31),
+    "pink": (243, 139, 170), "gray": (71, 79, 82), "light_gray": (157, 157, 151),
+    "cyan": (22, 156, 156), "purple": (137, 50, 184), "blue": (60, 68, 170),
+    "brown": (131, 84, 50), "green": (94, 124, 22), "red": (176, 46, 38), "black": (29, 29, 33)}
+
+
+#precomputed genestimationdict(n) results shipped with the package, see saveestimation
+estimationpath = path.join(path.dirname(__file__), "tables", "estimation%d.bin")
+
+def getestimationlookupdict():
+    '''returns estimationlookupdict, creating it on first use instead of at import time,
+    estimationlookupdict[10] is loaded from the precomputed table when it matches allcolors'''
+    global estimationlookupdict
+    try:
+        return estimationlookupdict
+    except NameError:
+        pass
+    lookup = {}
+    if alphacolor != (0,0,0):
+        lookup[10] = loadestimation(10) or genestimationdict(10)
+    estimationlookupdict = lookup
+    return lookup
+
+def __getattr__(name):
+    if name == "estimationlookupdict":
+        return getestimationlookupdict()
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
 
 def addestimate(n,todict=False):
     '''adds genestimation(n) to estimationlookup or estimationlookupdict at index n'''
@@ -253,8 +283,31 @@ def addestimate(n,todict=False):
         global estimationlookup
         estimationlookup[n] = genestimation(n)
     else:
-        global estimationlookupdict
-        estimationlookupdict[n] = genestimationdict(n)
+        getestimationlookupdict()[n] = genestimationdict(n)
+
+def palettedigest():
+    '''returns a digest of allcolors identifying the palette a precomputed table was made for'''
+    return hashlib.sha1(repr(allcolors).encode()).digest()
+
+def saveestimation(n,filename=None):
+    '''writes genestimationdict(n) as a precomputed table, palettedigest() followed by one byte per cell'''
+    lookup = genestimationdict(n)
+    cells = bytes(lookup[(rn,gn,bn)] for rn in range(n+1) for gn in range(n+1) for bn in range(n+1))
+    with open(filename or estimationpath % n, "wb") as f:
+        f.write(palettedigest() + cells)
+
+def loadestimation(n,filename=None):
+    '''returns the precomputed genestimationdict(n), or None if it is missing or made for another palette'''
+    try:
+        with open(filename or estimationpath % n, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    digest = palettedigest()
+    if data[:len(digest)] != digest or len(data) != len(digest) + (n+1)**3:
+        return None
+    cells = iter(data[len(digest):])
+    return dict(((rn,gn,bn), next(cells)) for rn in range(n+1) for gn in range(n+1) for bn in range(n+1))
 
 def genestimation(n):
     '''returns a nested list by estimating approximate() on interval n in every axis'''
@@ -302,6 +355,3 @@ def approximate(color):
     except KeyError:
         color = min(allcolors,key=partial(colordifference,color))
         return allcolorsinversemap[color]
-
-if alphacolor != (0,0,0):
-    addestimate(10)
@@ -0,0 +1,289 @@
+'''Comparing map colors and storing how a map changes over time.
+
+diff compares two colors arrays in bulk and returns the number of changed pixels, their
+bounding box and a few rectangles covering them. encodedelta stores only the changed
+runs of bytes, zlib compressed, so a snapshot that changed little takes a few bytes
+instead of a whole map file. History keeps a chain of versions in one append-only file,
+a full keyframe every keyframeinterval versions and deltas in between.
+
+Usage::
+
+ d = minecraftmap.diff.diff("old/map_0.dat","new/map_0.dat")
+ print(d.changed, d.bbox, d.regions)
+
+ history = minecraftmap.diff.History("map_0.history")
+ history.append(m)                       #a Map, map file path or colors
+ colors = history[-1]                    #bytearray of the latest version
+ counts = minecraftmap.diff.heatmap(history)
+ minecraftmap.diff.heatmapimage(counts).save("changes.png")
+'''
+
+import hashlib
+import os
+import re
+import struct
+import time
+import zlib
+from collections import namedtuple
+
+from PIL import Image
+
+#changed bytes of a mask are 1, unchanged 0
+nonzero = bytes([0]) + bytes([1]) * 255
+changedrun = re.compile(b"\x01+")
+
+MapDiff = namedtuple("MapDiff", ["changed", "bbox", "regions", "mask"])
+
+
+def colorsof(source):
+    '''returns the colors of a Map, a map file path or a bytes-like object of colors'''
+    if isinstance(source, (str, os.PathLike)):
+        from . import mapfile
+        return mapfile.readmapdata(source, ("colors",))["colors"]
+    if hasattr(source, "file"):
+        return source.file["data"]["colors"].value
+    return source
+
+
+def changemask(a,b):
+    '''returns bytes holding 1 where the equally long colors a and b differ and 0 elsewhere'''
+    if len(a) != len(b):
+        raise ValueError("colors differ in length: %d and %d" % (len(a), len(b)))
+    x = int.from_bytes(a, "little") ^ int.from_bytes(b, "little")
+    return x.to_bytes(len(a), "little").translate(nonzero)
+
+
+def regions(mask,width=128,tile=8):
+    '''returns boxes (x0,y0,x1,y1), end exclusive, covering every changed pixel of mask.
+    Changed tile x tile blocks are merged into rectangles which are then shrunk to the changes.'''
+    height = len(mask) // width
+    rowspans = {}
+    for y in range(height):
+        for m in changedrun.finditer(mask, y*width, (y+1)*width):
+            ty = y // tile
+            s = rowspans.setdefault(ty, set())
+            s.update(range((m.start() - y*width) // tile, (m.end() - 1 - y*width) // tile + 1))
+    #runs of changed tiles per tile row, extended downwards while the next row has the same run
+    boxes = []
+    previous = {}
+    for ty in range((height + tile - 1) // tile):
+        runs = []
+        for tx in sorted(rowspans.get(ty, ())):
+            if runs and runs[-1][1] == tx:
+                runs[-1][1] = tx + 1
+            else:
+                runs.append([tx, tx + 1])
+        current = {}
+        for tx0, tx1 in runs:
+            box = previous.get((tx0, tx1))
+            if box is None:
+                box = [tx0, ty, tx1, ty + 1]
+                boxes.append(box)
+            else:
+                box[3] = ty + 1
+            current[(tx0, tx1)] = box
+        previous = current
+    return [tightbox(mask, width, (b[0]*tile, b[1]*tile, min(b[2]*tile, width), min(b[3]*tile, height)))
+            for b in boxes]
+
+
+def tightbox(mask,width,box):
+    '''returns box shrunk to the changed pixels of mask inside it'''
+    x0, y0, x1, y1 = box
+    ys, left, right = [], x1, x0
+    for y in range(y0, y1):
+        row = mask[y*width + x0 : y*width + x1]
+        first = row.find(1)
+        if first >= 0:
+            ys.append(y)
+            left = min(left, x0 + first)
+            right = max(right, x0 + row.rfind(1) + 1)
+    return (left, ys[0], right, ys[-1] + 1)
+
+
+def diff(a,b,width=128,tile=8):
+    '''compares the colors of a and b (Maps, map file paths or colors), returns a MapDiff of the number
+    of changed pixels, their bounding box (None if equal), the boxes covering them and the change mask'''
+    mask = changemask(colorsof(a), colorsof(b))
+    changed = len(mask) - mask.count(0)
+    if not changed:
+        return MapDiff(0, None, [], mask)
+    boxes = regions(mask, width, tile)
+    bbox = (min(r[0] for r in boxes), min(r[1] for r in boxes), max(r[2] for r in boxes), max(r[3] for r in boxes))
+    return MapDiff(changed, bbox, boxes, mask)
+
+
+deltamagic = b"MMD\x01"
+deltaheader = struct.Struct(">4s8s8sI")
+runheader = struct.Struct(">II")
+#unchanged bytes between two changed runs that are stored instead of starting a new run
+deltagap = 8
+
+
+def digest(colors):
+    return hashlib.blake2b(colors, digest_size=8).digest()
+
+
+def encodedelta(old,new,level=9):
+    '''returns the delta turning colors old into new, the changed runs of bytes zlib compressed
+    with digests of old and new so applying it to the wrong version fails'''
+    old, new = colorsof(old), colorsof(new)
+    mask = changemask(old, new)
+    runs = bytearray()
+    start = end = None
+    for m in changedrun.finditer(mask):
+        if start is not None and m.start() - end <= deltagap:
+            end = m.end()
+            continue
+        if start is not None:
+            runs += runheader.pack(start, end - start) + new[start:end]
+        start, end = m.start(), m.end()
+    if start is not None:
+        runs += runheader.pack(start, end - start) + new[start:end]
+    return deltaheader.pack(deltamagic, digest(old), digest(new), len(new)) + zlib.compress(bytes(runs), level)
+
+
+def applydelta(old,delta):
+    '''returns a new bytearray of colors old with delta applied, raises ValueError if delta does not fit old'''
+    magic, olddigest, newdigest, size = deltaheader.unpack_from(delta)
+    if magic != deltamagic:
+        raise ValueError("not a map colors delta")
+    old = colorsof(old)
+    if len(old) != size or digest(old) != olddigest:
+        raise ValueError("delta was made for different colors")
+    colors = bytearray(old)
+    runs = zlib.decompress(delta[deltaheader.size:])
+    pos = 0
+    while pos < len(runs):
+        start, length = runheader.unpack_from(runs, pos)
+        pos += runheader.size
+        colors[start:start+length] = runs[pos:pos+length]
+        pos += length
+    if digest(colors) != newdigest:
+        raise ValueError("delta is corrupt")
+    return colors
+
+
+historymagic = b"MMH\x01"
+recordheader = struct.Struct(">cdI")
+
+
+class History():
+    #versions between two full keyframes, bounds how many deltas reading a version replays
+    keyframeinterval = 64
+
+    def __init__(self,path):
+        '''Opens or creates the append-only history file at path'''
+        self.path = path
+        #(kind, time, payload offset, payload length) of each version
+        self.records = []
+        self.last = None
+        #end of the last complete record, a crash may leave a partial record after it
+        self.end = len(historymagic)
+        if not os.path.exists(path):
+            with open(path, "wb") as f:
+                f.write(historymagic)
+            return
+        size = os.path.getsize(path)
+        with open(path, "rb") as f:
+            if f.read(len(historymagic)) != historymagic:
+                raise ValueError("not a map history file: " + str(path))
+            pos = len(historymagic)
+            while True:
+                header = f.read(recordheader.size)
+                if len(header) < recordheader.size:
+                    break
+                kind, t, length = recordheader.unpack(header)
+                pos += recordheader.size
+                if pos + length > size:
+                    break
+                self.records.append((kind, t, pos, length))
+                pos += length
+                self.end = pos
+                f.seek(pos)
+
+    def __len__(self):
+        return len(self.records)
+
+    def times(self):
+        '''returns the time of every version'''
+        return [r[1] for r in self.records]
+
+    def payload(self,f,i):
+        kind, t, pos, length = self.records[i]
+        f.seek(pos)
+        return kind, f.read(length)
+
+    def __getitem__(self,i):
+        '''returns version i as a bytearray, replaying the deltas since the keyframe before it'''
+        i = range(len(self.records))[i]
+        k = i
+        while self.records[k][0] != b"K":
+            k -= 1
+        with open(self.path, "rb") as f:
+            colors = bytearray(zlib.decompress(self.payload(f, k)[1]))
+            for j in range(k + 1, i + 1):
+                colors = applydelta(colors, self.payload(f, j)[1])
+        return colors
+
+    def __iter__(self):
+        '''yields every version in order, replaying the chain once'''
+        colors = None
+        with open(self.path, "rb") as f:
+            for i in range(len(self.records)):
+                kind, data = self.payload(f, i)
+                colors = bytearray(zlib.decompress(data)) if kind == b"K" else applydelta(colors, data)
+                yield colors
+
+    def append(self,source,t=None):
+        '''adds the colors of source (a Map, map file path or colors) as the newest version at time t
+        (default now), as a delta unless a keyframe is due, returns the number of bytes written'''
+        colors = bytes(colorsof(source))
+        if self.records and self.last is None:
+            self.last = bytes(self[-1])
+        keyframe = not self.records or len(self.records) % self.keyframeinterval == 0
+        if keyframe:
+            kind, data = b"K", zlib.compress(colors, 9)
+        else:
+            kind, data = b"D", encodedelta(self.last, colors)
+        t = time.time() if t is None else t
+        with open(self.path, "r+b") as f:
+            #drops a partially written record left by an interrupted append
+            f.truncate(self.end)
+            pos = f.seek(self.end)
+            f.write(recordheader.pack(kind, t, len(data)))
+            f.write(data)
+        self.records.append((kind, t, pos + recordheader.size, len(data)))
+        self.end = pos + recordheader.size + len(data)
+        self.last = colors
+        return recordheader.size + len(data)
+
+
+def heatmap(versions):
+    '''returns how often each pixel changed between consecutive versions, an iterable of colors
+    such as a History, as a list of counts'''
+    counts = []
+    previous = None
+    #masks are summed as big integers, one byte per pixel, flushed before any byte could overflow
+    total, summed = 0, 0
+    for colors in versions:
+        colors = bytes(colorsof(colors))
+        if previous is None:
+            counts = [0] * len(colors)
+        else:
+            total += int.from_bytes(changemask(previous, colors), "little")
+            summed += 1
+            if summed == 255:
+                counts = list(map(int.__add__, counts, total.to_bytes(len(counts), "little")))
+                total, summed = 0, 0
+        previous = colors
+    if summed:
+        counts = list(map(int.__add__, counts, total.to_bytes(len(counts), "little")))
+    return counts
+
+
+def heatmapimage(counts,width=128):
+    '''returns counts as an "L" image, brightest where a pixel changed most often'''
+    top = max(counts) if counts else 0
+    data = bytes(c * 255 // top for c in counts) if top else bytes(len(counts))
+    return Image.frombytes("L", (width, len(counts) // width), data)
@@ -0,0 +1,142 @@
+'''Opt-in timing and lookup counters for Map operations and the batch paths.
+
+Phases ("parse", "palette", "quantize", "genimage", "save", "render") record their call
+count and total seconds. Counters record how colors were resolved by approximate() and
+the vectorized quantizer: "approximate.exact" (allcolorsinversemap hit),
+"approximate.cube", "approximate.estimation" and "approximate.scan", once per distinct
+color, and "quantize.exact", "quantize.estimation" and "quantize.scan" per pixel of the
+vectorized quantizer.
+
+Everything is off by default, when disabled each hook is a single flag check.
+
+Usage::
+
+ with minecraftmap.instrument.collect() as stats:
+    m = minecraftmap.Map(filepath)
+    m.imagetonbt()
+ print(stats.snapshot())   #{"phases": {"parse": {"calls": 1, "seconds": ...}, ...}, "counters": {...}}
+
+ #or for a whole job, with a callback receiving the snapshot at the end
+ with minecraftmap.instrument.collect(callback=print):
+    ...
+'''
+
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+
+enabled = False
+
+lock = threading.Lock()
+phases = {}
+counters = {}
+
+nullphase = nullcontext()
+
+
+class Phase():
+    def __init__(self,name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self,*exc):
+        seconds = time.perf_counter() - self.start
+        with lock:
+            p = phases.setdefault(self.name, [0, 0.0])
+            p[0] += 1
+            p[1] += seconds
+
+
+def phase(name):
+    '''returns a context manager timing the named phase, or a shared no-op one when disabled'''
+    return Phase(name) if enabled else nullphase
+
+
+def timed(name):
+    '''decorator timing every call of a function as the named phase'''
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args,**kwargs):
+            if not enabled:
+                return function(*args,**kwargs)
+            with Phase(name):
+                return function(*args,**kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name,n=1):
+    '''adds n to the named counter, callers check enabled first in hot loops'''
+    if enabled:
+        with lock:
+            counters[name] = counters.get(name, 0) + n
+
+
+def enable():
+    global enabled
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def reset():
+    '''clears all phases and counters'''
+    with lock:
+        phases.clear()
+        counters.clear()
+
+
+def snapshot():
+    '''returns the current phases and counters as plain dicts'''
+    with lock:
+        return {
+            "phases": dict((k, {"calls": v[0], "seconds": v[1]}) for k, v in phases.items()),
+            "counters": dict(counters),
+            }
+
+
+def merge(stats):
+    '''adds a snapshot, for example from a worker process, to the current phases and counters'''
+    with lock:
+        for k, v in stats["phases"].items():
+            p = phases.setdefault(k, [0, 0.0])
+            p[0] += v["calls"]
+            p[1] += v["seconds"]
+        for k, v in stats["counters"].items():
+            counters[k] = counters.get(k, 0) + v
+
+
+class Collection():
+    '''result of collect(), snapshot() returns the statistics gathered inside the block'''
+    def __init__(self):
+        self.stats = None
+
+    def snapshot(self):
+        return self.stats if self.stats is not None else snapshot()
+
+
+@contextmanager
+def collect(callback=None):
+    '''enables instrumentation with fresh counters for the block, then restores the previous state,
+    the Collection yielded keeps the statistics and callback is called with them at the end'''
+    global enabled
+    previous = (enabled, snapshot())
+    reset()
+    enabled = True
+    collection = Collection()
+    try:
+        yield collection
+    finally:
+        collection.stats = snapshot()
+        enabled = previous[0]
+        reset()
+        merge(previous[1])
+        if callback:
+            callback(collection.stats)
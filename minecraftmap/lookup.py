@@ -0,0 +1,143 @@
+'''Dense rgb -> color code lookup cubes, cached on disk and keyed by palette contents.
+
+A cube with 8 bits per channel holds one byte for every rgb color (16 MiB) and gives
+exactly the same codes as a full nearest-color scan. 5 and 6 bit cubes are much smaller
+but sample each cell at its center, so like constants.estimationlookup they are approximate.
+Building a cube requires NumPy, loading a cached one does not.'''
+
+import hashlib
+import mmap
+import os
+import tempfile
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+#pixels per rgb slab passed to the builder, bounds memory use
+slabsize = 1 << 16
+
+cubes = {}
+
+
+def cachedir():
+    '''returns the directory cubes are cached in, $MINECRAFTMAP_CACHE or the user cache directory'''
+    d = os.environ.get("MINECRAFTMAP_CACHE")
+    if not d:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+        d = os.path.join(base, "minecraftmap")
+    return d
+
+
+def palettekey(allcolors,allcolorsinversemap):
+    '''returns a hex digest identifying the palette, duplicate colors included'''
+    h = hashlib.sha1()
+    for c in allcolors:
+        h.update(bytes(c[:3]))
+        h.update(bytes([allcolorsinversemap[c]]))
+    return h.hexdigest()
+
+
+def cubepath(allcolors,allcolorsinversemap,bits=8,directory=None):
+    '''returns the cache file path of a cube'''
+    name = "lookup-%s-%d.bin" % (palettekey(allcolors, allcolorsinversemap)[:16], bits)
+    return os.path.join(directory or cachedir(), name)
+
+
+def buildcube(allcolors,allcolorsinversemap,bits=8):
+    '''returns the cube as bytes, indexed by (r>>s)<<2b | (g>>s)<<b | (b>>s) where s = 8-bits'''
+    if np is None:
+        raise ImportError("NumPy is required to build lookup cubes, install minecraftmap[numpy]")
+    if not 1 <= bits <= 8:
+        raise ValueError("bits must be between 1 and 8")
+    shift = 8 - bits
+    side = 1 << bits
+    palette = np.array([c[:3] for c in allcolors], dtype=np.float32)
+    canonical = np.array([allcolorsinversemap[c] for c in allcolors], dtype=np.uint8)
+    #argmin |x-p|^2 == argmin |p|^2 - 2 x.p, every term is an integer below 2**24 so float32 is exact
+    norms = np.einsum("ij,ij->i", palette, palette)
+    values = (np.arange(side, dtype=np.float32) * (1 << shift)) + ((1 << shift) >> 1)
+    grid = np.stack(np.meshgrid(values, values, values, indexing="ij"), axis=-1).reshape(-1, 3)
+    out = np.empty(len(grid), dtype=np.uint8)
+    for start in range(0, len(grid), slabsize):
+        d = norms - 2 * (grid[start:start+slabsize] @ palette.T)
+        out[start:start+slabsize] = canonical[np.argmin(d, axis=1)]
+    return out.tobytes()
+
+
+class LookupCube():
+    def __init__(self,buffer,bits=8):
+        '''Wraps a cube buffer (bytes, bytearray or mmap)'''
+        self.buffer = buffer
+        self.bits = bits
+        self.shift = 8 - bits
+        if len(buffer) != 1 << (3*bits):
+            raise ValueError("cube buffer has the wrong size for %d bits" % bits)
+
+    def index(self,color):
+        '''returns the buffer index of an rgb(a) color'''
+        s, b = self.shift, self.bits
+        return ((color[0] >> s) << (2*b)) | ((color[1] >> s) << b) | (color[2] >> s)
+
+    def __getitem__(self,color):
+        '''returns the color code of an rgb(a) color'''
+        return self.buffer[self.index(color)]
+
+    def array(self):
+        '''returns the cube as a flat NumPy array without copying'''
+        return np.frombuffer(self.buffer, dtype=np.uint8)
+
+    def quantize(self,pixels):
+        '''returns a bytearray of color codes for a (pixels, bands) NumPy array'''
+        s, b = self.shift, self.bits
+        p = np.asarray(pixels)[:, :3].astype(np.intp) >> s
+        i = (p[:, 0] << (2*b)) | (p[:, 1] << b) | p[:, 2]
+        return bytearray(self.array()[i].tobytes())
+
+
+def savecube(data,path):
+    '''writes cube data atomically to path'''
+    from . import mapfile
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.chmod(tmp, mapfile.filemode(path))
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def loadcube(path,bits=8):
+    '''returns a memory-mapped LookupCube from a cache file'''
+    with open(path, "rb") as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return LookupCube(buffer, bits)
+
+
+def getcube(allcolors,allcolorsinversemap,bits=8,directory=None,usecache=True):
+    '''returns the LookupCube for a palette, loading it from the disk cache
+    or building and caching it on first use'''
+    path = cubepath(allcolors, allcolorsinversemap, bits, directory)
+    if path in cubes:
+        return cubes[path]
+    cube = None
+    if usecache and os.path.exists(path):
+        try:
+            cube = loadcube(path, bits)
+        except (OSError, ValueError):
+            cube = None
+    if cube is None:
+        data = buildcube(allcolors, allcolorsinversemap, bits)
+        if usecache:
+            try:
+                savecube(data, path)
+            except OSError:
+                pass
+        cube = LookupCube(data, bits)
+    cubes[path] = cube
+    return cube
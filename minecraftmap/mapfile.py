@@ -0,0 +1,208 @@
+'''Lightweight reader and fast writer for map .dat files.
+
+readmapdata decompresses the file in one call and walks the NBT bytes directly, skipping
+every tag that was not asked for, without building an nbt tag tree or any PIL objects.
+For scanning jobs that only need metadata or the raw color bytes.
+
+writenbt serializes an nbt.NBTFile with the byte arrays (the map colors) passed straight
+to the compressor, a selectable gzip level and an atomic temp file and rename.
+
+Usage::
+
+ data = minecraftmap.mapfile.readmapdata("map_0.dat")
+ data["scale"], data["xCenter"], data["zCenter"], data["dimension"], data["banners"]
+ data["colors"] #bytearray of 16384 color codes
+ 
+ minecraftmap.mapfile.writenbt(m.file,"map_0.dat",compresslevel=1)
+'''
+
+import gzip
+import io
+import os
+import stat
+import struct
+import tempfile
+import zlib
+
+TAG_END, TAG_BYTE, TAG_SHORT, TAG_INT, TAG_LONG, TAG_FLOAT, TAG_DOUBLE, TAG_BYTE_ARRAY, \
+    TAG_STRING, TAG_LIST, TAG_COMPOUND, TAG_INT_ARRAY, TAG_LONG_ARRAY = range(13)
+
+#struct formats of the fixed size payloads
+scalars = {TAG_BYTE: ">b", TAG_SHORT: ">h", TAG_INT: ">i", TAG_LONG: ">q", TAG_FLOAT: ">f", TAG_DOUBLE: ">d"}
+sizes = dict((t, struct.calcsize(f)) for t, f in scalars.items())
+arrays = {TAG_BYTE_ARRAY: 1, TAG_INT_ARRAY: 4, TAG_LONG_ARRAY: 8}
+
+#tags of the "data" compound read by default
+defaultnames = ("scale", "dimension", "xCenter", "zCenter", "banners", "colors")
+
+
+class NBTFormatError(Exception):
+    pass
+
+
+def skip(buf,tagtype,pos):
+    '''returns the position after a payload of tagtype starting at pos'''
+    if tagtype in sizes:
+        return pos + sizes[tagtype]
+    if tagtype in arrays:
+        return pos + 4 + struct.unpack_from(">i", buf, pos)[0] * arrays[tagtype]
+    if tagtype == TAG_STRING:
+        return pos + 2 + struct.unpack_from(">H", buf, pos)[0]
+    if tagtype == TAG_LIST:
+        itemtype, n = struct.unpack_from(">bi", buf, pos)
+        pos += 5
+        if itemtype in sizes:
+            return pos + n * sizes[itemtype]
+        for i in range(n):
+            pos = skip(buf, itemtype, pos)
+        return pos
+    if tagtype == TAG_COMPOUND:
+        while True:
+            t = buf[pos]
+            if t == TAG_END:
+                return pos + 1
+            pos += 3 + struct.unpack_from(">H", buf, pos + 1)[0]
+            pos = skip(buf, t, pos)
+    raise NBTFormatError("unknown tag type %d at %d" % (tagtype, pos))
+
+
+def read(buf,tagtype,pos,names=None):
+    '''returns (value, position after the payload) of a payload of tagtype starting at pos,
+    compounds become dicts holding only names (all tags if None), lists become lists and byte arrays bytearrays'''
+    if tagtype in scalars:
+        return struct.unpack_from(scalars[tagtype], buf, pos)[0], pos + sizes[tagtype]
+    if tagtype == TAG_BYTE_ARRAY:
+        n = struct.unpack_from(">i", buf, pos)[0]
+        return bytearray(buf[pos+4:pos+4+n]), pos + 4 + n
+    if tagtype in (TAG_INT_ARRAY, TAG_LONG_ARRAY):
+        n = struct.unpack_from(">i", buf, pos)[0]
+        f = ">%d%s" % (n, "i" if tagtype == TAG_INT_ARRAY else "q")
+        return list(struct.unpack_from(f, buf, pos + 4)), pos + 4 + n * arrays[tagtype]
+    if tagtype == TAG_STRING:
+        n = struct.unpack_from(">H", buf, pos)[0]
+        return bytes(buf[pos+2:pos+2+n]).decode("utf-8", "replace"), pos + 2 + n
+    if tagtype == TAG_LIST:
+        itemtype, n = struct.unpack_from(">bi", buf, pos)
+        pos += 5
+        items = []
+        for i in range(n):
+            item, pos = read(buf, itemtype, pos)
+            items.append(item)
+        return items, pos
+    if tagtype == TAG_COMPOUND:
+        value = {}
+        while True:
+            t = buf[pos]
+            if t == TAG_END:
+                return value, pos + 1
+            n = struct.unpack_from(">H", buf, pos + 1)[0]
+            name = bytes(buf[pos+3:pos+3+n]).decode("utf-8", "replace")
+            pos += 3 + n
+            if names is None or name in names:
+                value[name], pos = read(buf, t, pos)
+            else:
+                pos = skip(buf, t, pos)
+    raise NBTFormatError("unknown tag type %d at %d" % (tagtype, pos))
+
+
+def loads(raw,names=defaultnames):
+    '''returns the "data" compound of a map file's (gzipped or uncompressed) bytes as a dict holding only names'''
+    if raw[:2] == b"\x1f\x8b":
+        try:
+            raw = zlib.decompress(raw, 31)
+        except zlib.error as e:
+            raise NBTFormatError("bad gzip data: " + str(e))
+    buf = memoryview(raw)
+    try:
+        if buf[0] != TAG_COMPOUND:
+            raise NBTFormatError("root tag is not a compound")
+        pos = 3 + struct.unpack_from(">H", buf, 1)[0]
+        while buf[pos] != TAG_END:
+            t = buf[pos]
+            n = struct.unpack_from(">H", buf, pos + 1)[0]
+            name = bytes(buf[pos+3:pos+3+n])
+            pos += 3 + n
+            if name == b"data" and t == TAG_COMPOUND:
+                return read(buf, t, pos, names)[0]
+            pos = skip(buf, t, pos)
+    except (IndexError, struct.error):
+        raise NBTFormatError("truncated nbt data")
+    raise NBTFormatError("no data compound")
+
+
+def readmapdata(filename,names=defaultnames):
+    '''returns the "data" compound of a map file as a dict holding only names (all tags if None)'''
+    with open(filename, "rb") as f:
+        return loads(f.read(), names)
+
+
+def writetag(stream,tag,pending):
+    '''writes the payload of an nbt tag, small pieces are collected in the pending bytearray
+    and byte arrays are written to stream as they are, after flushing pending'''
+    if tag.id == TAG_COMPOUND:
+        for t in tag.tags:
+            name = t.name.encode("utf-8")
+            pending += struct.pack(">bH", t.id, len(name))
+            pending += name
+            writetag(stream, t, pending)
+        pending.append(TAG_END)
+    elif tag.id == TAG_BYTE_ARRAY:
+        pending += struct.pack(">i", len(tag.value))
+        stream.write(pending)
+        del pending[:]
+        stream.write(tag.value if isinstance(tag.value, (bytes, bytearray)) else bytes(tag.value))
+    elif tag.id in scalars:
+        pending += struct.pack(scalars[tag.id], tag.value)
+    else:
+        buf = io.BytesIO()
+        tag._render_buffer(buf)
+        pending += buf.getvalue()
+
+
+def dumpnbt(nbtfile,stream):
+    '''writes an uncompressed nbt.NBTFile to a binary stream'''
+    name = (nbtfile.name or "").encode("utf-8")
+    pending = bytearray(struct.pack(">bH", TAG_COMPOUND, len(name)) + name)
+    writetag(stream, nbtfile, pending)
+    stream.write(pending)
+
+
+#process umask, read once when a new file's mode is first needed
+umask = None
+
+
+def filemode(filename):
+    '''returns the permission bits for a file written over filename, those of the existing file
+    or, for a new file, the default 0o666 masked by the umask'''
+    global umask
+    try:
+        return stat.S_IMODE(os.stat(filename).st_mode)
+    except FileNotFoundError:
+        if umask is None:
+            umask = os.umask(0)
+            os.umask(umask)
+        return 0o666 & ~umask
+
+
+def writenbt(nbtfile,filename,compresslevel=9,atomic=True):
+    '''writes an nbt.NBTFile gzipped to filename, compresslevel 1 is fastest and 9 smallest,
+    atomic writes a temporary file next to filename and renames it over filename when complete'''
+    if not atomic:
+        with open(filename, "wb") as f:
+            with gzip.GzipFile(fileobj=f, mode="wb", compresslevel=compresslevel, mtime=0) as gz:
+                dumpnbt(nbtfile, gz)
+        return
+    directory = os.path.dirname(os.path.abspath(filename))
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".dat")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            with gzip.GzipFile(fileobj=f, mode="wb", compresslevel=compresslevel, mtime=0) as gz:
+                dumpnbt(nbtfile, gz)
+            f.flush()
+            os.fsync(f.fileno())
+        #mkstemp creates the file as 0600, keep the permissions the target had
+        os.chmod(tmp, filemode(filename))
+        os.replace(tmp, filename)
+    except BaseException:
+        os.unlink(tmp)
+        raise
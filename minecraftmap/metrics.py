@@ -0,0 +1,140 @@
+'''Color distance metrics for matching colors to the map palette.
+
+"rgb" is squared rgb distance, the same as Map.colordifference and the default.
+"redmean" weights the rgb channels by the mean red of both colors.
+"lab" is squared CIE76 delta E, euclidean distance in CIELAB (D65).
+
+A PaletteIndex converts the palette once per metric and memoizes the nearest code of
+the last memosize colors it has seen for all maps sharing that palette, so a better
+metric costs little more than the plain rgb scan. Array methods require NumPy.'''
+
+from functools import lru_cache
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+metricnames = ("rgb", "redmean", "lab")
+
+#number of pixels compared against the whole palette at once, bounds memory use
+chunksize = 4096
+
+#distinct colors each PaletteIndex remembers, least recently used ones are dropped first
+memosize = 1 << 16
+
+def srgbtolinear(v):
+    '''converts an 0-255 srgb channel to linear light'''
+    v = v / 255
+    return v / 12.92 if v <= 0.04045 else ((v + 0.055) / 1.055) ** 2.4
+
+def labf(t):
+    return t ** (1/3) if t > 216/24389 else (24389/27 * t + 16) / 116
+
+def rgbtolab(color):
+    '''returns the CIELAB (L, a, b) of an rgb color'''
+    r, g, b = (srgbtolinear(v) for v in color[:3])
+    x = (0.4124564*r + 0.3575761*g + 0.1804375*b) / 0.95047
+    y = (0.2126729*r + 0.7151522*g + 0.0721750*b)
+    z = (0.0193339*r + 0.1191920*g + 0.9503041*b) / 1.08883
+    fx, fy, fz = labf(x), labf(y), labf(z)
+    return (116*fy - 16, 500*(fx - fy), 200*(fy - fz))
+
+def rgbtolabarray(rgb):
+    '''returns the CIELAB of a (pixels, 3) rgb array as float32'''
+    v = np.asarray(rgb, dtype=np.float64) / 255
+    v = np.where(v <= 0.04045, v / 12.92, ((v + 0.055) / 1.055) ** 2.4)
+    m = np.array([[0.4124564, 0.3575761, 0.1804375],
+                  [0.2126729, 0.7151522, 0.0721750],
+                  [0.0193339, 0.1191920, 0.9503041]])
+    xyz = (v @ m.T) / np.array([0.95047, 1.0, 1.08883])
+    f = np.where(xyz > 216/24389, np.cbrt(xyz), (24389/27 * xyz + 16) / 116)
+    lab = np.stack([116*f[:, 1] - 16, 500*(f[:, 0] - f[:, 1]), 200*(f[:, 1] - f[:, 2])], axis=1)
+    return lab.astype(np.float32)
+
+def rgbdifference(testcolor,comparecolor):
+    '''returns rgb distance squared'''
+    return ((testcolor[0]-comparecolor[0])**2+
+            (testcolor[1]-comparecolor[1])**2+
+            (testcolor[2]-comparecolor[2])**2)
+
+def redmeandifference(testcolor,comparecolor):
+    '''returns the redmean weighted rgb distance squared'''
+    rmean = (testcolor[0]+comparecolor[0]) / 2
+    return ((2+rmean/256)*(testcolor[0]-comparecolor[0])**2+
+            4*(testcolor[1]-comparecolor[1])**2+
+            (2+(255-rmean)/256)*(testcolor[2]-comparecolor[2])**2)
+
+def labdifference(testlab,comparelab):
+    '''returns CIE76 delta E squared of two CIELAB colors'''
+    return ((testlab[0]-comparelab[0])**2+
+            (testlab[1]-comparelab[1])**2+
+            (testlab[2]-comparelab[2])**2)
+
+
+class PaletteIndex():
+    def __init__(self,allcolors,allcolorsinversemap,metric="rgb",opaque=False):
+        '''Converts allcolors once for metric, opaque leaves out the transparent codes 0-3'''
+        if metric not in metricnames:
+            raise ValueError("unknown color metric: " + str(metric))
+        self.metric = metric
+        self.indices = list(range(4 if opaque else 0, len(allcolors)))
+        self.colors = [tuple(allcolors[i][:3]) for i in self.indices]
+        self.codes = [allcolorsinversemap[allcolors[i]] for i in self.indices]
+        if metric == "lab":
+            self.points = [rgbtolab(c) for c in self.colors]
+            self.difference = labdifference
+        else:
+            self.points = self.colors
+            self.difference = rgbdifference if metric == "rgb" else redmeandifference
+        self.memo = lru_cache(maxsize=memosize)(self.scan)
+        self.arrays = None
+
+    def scan(self,color):
+        '''returns the code of the nearest palette color to an rgb tuple, the first one on ties like min()'''
+        p = rgbtolab(color) if self.metric == "lab" else color
+        d = self.difference
+        best = min(range(len(self.points)), key=lambda i: d(p, self.points[i]))
+        return self.codes[best]
+
+    def nearest(self,color):
+        '''returns the code of the nearest palette color, memoized'''
+        return self.memo(tuple(color[:3]))
+
+    def nearestarray(self,rgb):
+        '''returns a uint8 array with the code of the nearest palette color for each row of a (pixels, 3+) array'''
+        if self.arrays is None:
+            points = np.array(self.points, dtype=np.float32 if self.metric == "lab" else np.int64)
+            self.arrays = (points, np.array(self.codes, dtype=np.uint8))
+        points, codes = self.arrays
+        #only the distinct colors are compared with the palette
+        packed = np.asarray(rgb)[:, :3].astype(np.uint32)
+        packed = (packed[:, 0] << 16) | (packed[:, 1] << 8) | packed[:, 2]
+        unique, inverse = np.unique(packed, return_inverse=True)
+        rgb = np.stack([unique >> 16, (unique >> 8) & 255, unique & 255], axis=1)
+        out = np.empty(len(rgb), dtype=np.uint8)
+        for start in range(0, len(rgb), chunksize):
+            chunk = rgb[start:start+chunksize]
+            if self.metric == "lab":
+                lab = rgbtolabarray(chunk)
+                d = np.einsum("ij,ij->i", points, points) - 2 * (lab @ points.T)
+            elif self.metric == "rgb":
+                diff = chunk.astype(np.int64)[:, None, :] - points[None, :, :]
+                d = np.einsum("ijk,ijk->ij", diff, diff)
+            else:
+                diff = (chunk.astype(np.float64)[:, None, :] - points[None, :, :]) ** 2
+                rmean = (chunk[:, 0].astype(np.float64)[:, None] + points[None, :, 0]) / 2
+                d = (2 + rmean/256)*diff[:, :, 0] + 4*diff[:, :, 1] + (2 + (255-rmean)/256)*diff[:, :, 2]
+            out[start:start+chunksize] = codes[np.argmin(d, axis=1)]
+        return out[inverse.reshape(-1)]
+
+
+indexes = {}
+
+def getindex(allcolors,allcolorsinversemap,metric="rgb",opaque=False):
+    '''returns the shared PaletteIndex of a palette and metric'''
+    key = (tuple(allcolors), metric, opaque)
+    index = indexes.get(key)
+    if index is None:
+        index = indexes[key] = PaletteIndex(allcolors, allcolorsinversemap, metric, opaque)
+    return index
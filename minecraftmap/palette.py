@@ -0,0 +1,84 @@
+'''Immutable, shared map palettes.
+
+A Palette holds everything derived from an alpha color and the base colors: the
+allcolors tuple, the allcolorsinversemap mapping and the raw "P" image palette, plus
+the lookup cube, quantizer and metric indexes, which are built on first use. Palettes
+are interned, Palette.get returns the same object for the same colors, so every Map
+shares one and constructing maps does no palette work. Palettes are never mutated
+after construction and the lazily built tables are created under a lock, so they are
+safe to share between threads.
+'''
+
+import hashlib
+import threading
+from types import MappingProxyType
+
+from . import constants
+
+
+class Palette():
+    def __init__(self,alphacolor,basecolors,multipliers=tuple(constants.multipliers)):
+        '''Builds the palette, basecolors[0] is ignored and alphacolor used for codes 0-3 instead.
+        Use Palette.get to share palettes.'''
+        self.alphacolor = tuple(alphacolor)
+        self.basecolors = (self.alphacolor,) + tuple(tuple(c) for c in basecolors[1:])
+        self.multipliers = tuple(multipliers)
+        allcolors = [self.alphacolor] * len(self.multipliers)
+        for c in self.basecolors[1:]:
+            allcolors.extend(tuple(v * m // 255 for v in c) for m in self.multipliers)
+        self.allcolors = tuple(allcolors)
+        #later entries win, so the alpha color maps to code 3 like constants.allcolorsinversemap
+        self.allcolorsinversemap = MappingProxyType(dict((c, i) for i, c in enumerate(self.allcolors)))
+        data = bytearray(256*4)
+        for i, c in enumerate(self.allcolors[:256]):
+            data[i*4:i*4+4] = bytes(c[:3]) + bytes([c[3] if len(c) > 3 else 255])
+        #allcolors as 256 RGBA entries for "P" mode images, unused codes are transparent
+        self.palettedata = bytes(data)
+        #identifies the rendered colors, for cache keys
+        self.digest = hashlib.blake2b(self.palettedata, digest_size=16).hexdigest()
+        self.lock = threading.Lock()
+        self.tables = {}
+
+    def __repr__(self):
+        return "Palette(%r, <%d base colors>)" % (self.alphacolor, len(self.basecolors))
+
+    def table(self,key,build):
+        '''returns the derived table stored under key, calling build() once to create it'''
+        t = self.tables.get(key)
+        if t is None:
+            with self.lock:
+                t = self.tables.get(key)
+                if t is None:
+                    t = self.tables[key] = build()
+        return t
+
+    def getlookupcube(self,bits=8):
+        '''returns the lookup.LookupCube of this palette'''
+        from . import lookup
+        return self.table(("cube", bits), lambda: lookup.getcube(self.allcolors, self.allcolorsinversemap, bits))
+
+    def getquantizer(self):
+        '''returns the quantize.Quantizer of this palette'''
+        from . import quantize
+        return self.table("quantizer", lambda: quantize.getquantizer(self.allcolors, self.allcolorsinversemap))
+
+    def getindex(self,metric="rgb",opaque=False):
+        '''returns the metrics.PaletteIndex of this palette for metric'''
+        from . import metrics
+        return self.table(("index", metric, opaque),
+                          lambda: metrics.getindex(self.allcolors, self.allcolorsinversemap, metric, opaque))
+
+    palettes = {}
+    internlock = threading.Lock()
+
+    @classmethod
+    def get(cls,alphacolor=constants.alphacolor,basecolors=constants.basecolors,multipliers=tuple(constants.multipliers)):
+        '''returns the shared Palette for these colors'''
+        key = (tuple(alphacolor), tuple(tuple(c) for c in basecolors[1:]), tuple(multipliers))
+        p = cls.palettes.get(key)
+        if p is None:
+            with cls.internlock:
+                p = cls.palettes.get(key)
+                if p is None:
+                    p = cls.palettes[key] = cls(alphacolor, basecolors, multipliers)
+        return p
@@ -0,0 +1,195 @@
+'''Batched quantization of image data to minecraft map color codes.
+
+Requires NumPy, which is an optional dependency (pip install minecraftmap[numpy]).
+Quantizer.quantize is byte-identical to calling Map.approximate on every pixel,
+Quantizer.dither adds floyd-steinberg and ordered (bayer) dithering.'''
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from . import constants
+from . import metrics
+from . import instrument
+
+#number of pixels compared against the whole palette at once, bounds memory use
+chunksize = 4096
+
+def requirenumpy():
+    '''raises ImportError if NumPy is not available'''
+    if np is None:
+        raise ImportError("NumPy is required for vectorized quantization, install minecraftmap[numpy]")
+
+
+#bayer threshold matrices, normalized to [-0.5, 0.5)
+bayermatrices = {}
+
+def bayermatrix(n):
+    '''returns the n*n bayer threshold matrix normalized to [-0.5, 0.5), n is a power of two'''
+    if n not in bayermatrices:
+        m = np.zeros((1, 1))
+        while len(m) < n:
+            m = np.block([[4*m, 4*m+2], [4*m+3, 4*m+1]])
+        bayermatrices[n] = ((m + 0.5) / (n*n) - 0.5).astype(np.float32)
+    return bayermatrices[n]
+
+
+def imagepixels(im):
+    '''returns a (height, width, bands) uint8 array of an RGB or RGBA PIL image, other modes are converted to RGBA'''
+    requirenumpy()
+    if im.mode not in ("RGB","RGBA"):
+        im = im.convert("RGBA")
+    return np.asarray(im, dtype=np.uint8)
+
+
+def imagearray(im):
+    '''returns a (pixels, bands) uint8 array of an RGB or RGBA PIL image, other modes are converted to RGBA'''
+    a = imagepixels(im)
+    return a.reshape(-1, a.shape[-1])
+
+
+class Quantizer():
+    def __init__(self,allcolors,allcolorsinversemap):
+        '''Precomputes palette arrays for allcolors, resolving duplicate colors
+        to the code allcolorsinversemap gives them, the same way Map.approximate does'''
+        requirenumpy()
+        self.allcolors = list(allcolors)
+        self.allcolorsinversemap = dict(allcolorsinversemap)
+        self.palette = np.array([c[:3] for c in self.allcolors], dtype=np.int32)
+        #code returned when the palette entry at each index is the nearest one
+        self.canonical = np.array([self.allcolorsinversemap[c] for c in self.allcolors], dtype=np.uint8)
+        self.lookuptables = {}
+        #codes 0-3 are transparent, dithering only diffuses between the other entries
+        self.opaque = np.arange(4, len(self.allcolors))
+        self.opaquepalette = self.palette[self.opaque].astype(np.float32)
+        self.transparent = self.canonical[0]
+
+    def exacthits(self,pixels):
+        '''returns (mask, codes) of pixels whose full tuple is a key of allcolorsinversemap'''
+        bands = pixels.shape[1]
+        mask = np.zeros(len(pixels), dtype=bool)
+        codes = np.zeros(len(pixels), dtype=np.uint8)
+        for color, code in self.allcolorsinversemap.items():
+            if len(color) != bands:
+                continue
+            hit = np.all(pixels == np.array(color, dtype=pixels.dtype), axis=1)
+            mask |= hit
+            codes[hit] = code
+        return mask, codes
+
+    def nearest(self,pixels):
+        '''returns the code of the nearest palette color by rgb distance squared for each pixel'''
+        return metrics.getindex(self.allcolors, self.allcolorsinversemap).nearestarray(pixels)
+
+    def lookuptable(self,lookupindex,uselookupdict=False):
+        '''returns constants.estimationlookup[lookupindex] (or estimationlookupdict) as an array, or None if absent'''
+        key = (lookupindex, uselookupdict)
+        if key not in self.lookuptables:
+            n = lookupindex
+            if uselookupdict and n in constants.estimationlookupdict:
+                table = np.zeros((n+1,n+1,n+1), dtype=np.uint8)
+                for rgb, code in constants.estimationlookupdict[n].items():
+                    table[rgb] = code
+            elif not uselookupdict and n in constants.estimationlookup:
+                table = np.array(constants.estimationlookup[n], dtype=np.uint8)
+            else:
+                table = None
+            self.lookuptables[key] = table
+        return self.lookuptables[key]
+
+    def quantize(self,pixels,lookupindex=None,uselookupdict=False,metric="rgb"):
+        '''returns a bytearray of color codes for a (pixels, bands) array,
+        lookupindex selects an estimation table like Map.approximate, None always finds the nearest color,
+        metric is one of metrics.metricnames, the estimation tables are only used for "rgb"'''
+        pixels = np.asarray(pixels)
+        mask, codes = self.exacthits(pixels)
+        rest = ~mask
+        table = self.lookuptable(lookupindex, uselookupdict) if lookupindex is not None else None
+        if metric != "rgb":
+            codes[rest] = metrics.getindex(self.allcolors, self.allcolorsinversemap, metric).nearestarray(pixels[rest])
+        elif table is not None:
+            i = pixels[rest, :3].astype(np.int32) * lookupindex // 255
+            codes[rest] = table[i[:, 0], i[:, 1], i[:, 2]]
+        else:
+            codes[rest] = self.nearest(pixels[rest])
+        if instrument.enabled:
+            misses = int(np.count_nonzero(rest))
+            instrument.count("quantize.exact", len(pixels) - misses)
+            instrument.count("quantize.estimation" if table is not None and metric == "rgb" else "quantize.scan", misses)
+        return bytearray(codes.tobytes())
+
+    def nearestopaque(self,rgb,metric="rgb"):
+        '''returns the nearest opaque code for each row of a float (pixels, 3) array'''
+        if metric != "rgb":
+            index = metrics.getindex(self.allcolors, self.allcolorsinversemap, metric, opaque=True)
+            return index.nearestarray(np.rint(rgb))
+        out = np.empty(len(rgb), dtype=np.uint8)
+        norms = np.einsum("ij,ij->i", self.opaquepalette, self.opaquepalette)
+        for start in range(0, len(rgb), chunksize):
+            d = norms - 2 * (rgb[start:start+chunksize] @ self.opaquepalette.T)
+            out[start:start+chunksize] = self.canonical[self.opaque[np.argmin(d, axis=1)]]
+        return out
+
+    def dither(self,pixels,method="floydsteinberg",strength=32,matrixsize=4,metric="rgb"):
+        '''returns a bytearray of color codes for a (height, width, bands) array with dithering,
+        method is "floydsteinberg" (error diffusion), "bayer" (ordered, strength is the spread in rgb units)
+        or None (the nearest opaque color, no dithering).
+        Pixels with alpha below 128 become the transparent code and take no part in the diffusion.'''
+        pixels = np.asarray(pixels)
+        h, w = pixels.shape[:2]
+        rgb = pixels[:, :, :3].astype(np.float32)
+        if pixels.shape[2] > 3:
+            transparent = pixels[:, :, 3] < 128
+        else:
+            transparent = np.zeros((h, w), dtype=bool)
+        if method is None:
+            codes = self.nearestopaque(rgb.reshape(-1, 3), metric).reshape(h, w)
+        elif method == "bayer":
+            m = bayermatrix(matrixsize)
+            threshold = np.tile(m, (-(-h // matrixsize), -(-w // matrixsize)))[:h, :w]
+            rgb = np.clip(rgb + strength * threshold[:, :, None], 0, 255)
+            codes = self.nearestopaque(rgb.reshape(-1, 3), metric).reshape(h, w)
+        elif method == "floydsteinberg":
+            codes = self.floydsteinberg(rgb, transparent, metric)
+        else:
+            raise ValueError("unknown dithering method: " + str(method))
+        codes[transparent] = self.transparent
+        return bytearray(codes.tobytes())
+
+    def floydsteinberg(self,rgb,transparent,metric="rgb"):
+        '''returns (height, width) codes for a float rgb array with floyd-steinberg error diffusion.
+        Pixels with equal x+2y do not depend on each other, so each such diagonal is quantized at once.'''
+        h, w = rgb.shape[:2]
+        buf = rgb.copy()
+        codes = np.zeros((h, w), dtype=np.uint8)
+        opaque = ~transparent
+        colors = np.zeros((256, 3), dtype=np.float32)
+        colors[:len(self.allcolors)] = self.palette
+        for k in range(w + 2*(h-1)):
+            y = np.arange(max(0, -(-(k-w+1) // 2)), min(h-1, k // 2) + 1)
+            x = k - 2*y
+            y, x = y[opaque[y, x]], x[opaque[y, x]]
+            if not len(y):
+                continue
+            old = np.clip(buf[y, x], 0, 255)
+            c = self.nearestopaque(old, metric)
+            codes[y, x] = c
+            err = old - colors[c]
+            for dy, dx, weight in ((0, 1, 7/16), (1, -1, 3/16), (1, 0, 5/16), (1, 1, 1/16)):
+                ty, tx = y + dy, x + dx
+                keep = (ty < h) & (tx >= 0) & (tx < w)
+                buf[ty[keep], tx[keep]] += err[keep] * weight
+        return codes
+
+
+quantizers = {}
+
+def getquantizer(allcolors,allcolorsinversemap):
+    '''returns a shared Quantizer for the given palette'''
+    key = tuple(allcolors)
+    q = quantizers.get(key)
+    if q is None or q.allcolorsinversemap != allcolorsinversemap:
+        q = Quantizer(allcolors, allcolorsinversemap)
+        quantizers[key] = q
+    return q
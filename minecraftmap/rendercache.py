@@ -0,0 +1,212 @@
+'''Content-addressed cache of rendered map images.
+
+Renders are keyed by a hash of the color bytes, the palette, the map scale, the rescale
+factor and the image format, so a map whose colors did not change is served from the
+cache without building an NBT tag tree, a PIL image or encoding anything. Entries are
+kept in memory and, with a directory, on disk, each with its own size bound and least
+recently used entries evicted first. The disk cache can be shared between processes: each
+one rescans the directory for the real total whenever it has written a sixteenth of
+maxdiskbytes or its own count goes over the bound, so N processes keep the directory
+within maxdiskbytes plus N sixteenths of it.
+
+Usage::
+
+ cache = minecraftmap.rendercache.RenderCache("rendercache",maxbytes=64<<20,maxdiskbytes=1<<30)
+ png = cache.render(filepath)           #encoded bytes, rendered only if the colors changed
+ png = cache.render(filepath,"jpg",rescale=2)
+
+ minecraftmap-render "saves/Test World/data" renders/ --cache rendercache
+'''
+
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+from . import instrument
+
+caches = {}
+
+
+def renderkey(colors,palette,scale=0,rescale=None,format="png"):
+    '''returns the hex cache key of a render, palette is a palette.Palette'''
+    h = hashlib.blake2b(digest_size=20)
+    h.update(("%s:%d:%s:%s:" % (palette.digest, scale, rescale, format)).encode("ascii"))
+    h.update(colors)
+    return h.hexdigest()
+
+
+def renderdata(data,format="png",rescale=None):
+    '''returns the encoded image of a map "data" dict as read by mapfile.readmapdata'''
+    from . import Map
+    m = Map(eco=True)
+    m.file["data"]["colors"].value = data["colors"]
+    m.zoomlevel = data.get("scale", 0)
+    m.scalemultiplier = 2 ** m.zoomlevel
+    m.genimage(palettized=True)
+    if rescale is not None:
+        m.rescale(rescale)
+    return m.imagebytes(format)
+
+
+class RenderCache():
+    #bytes a process writes, as a fraction of maxdiskbytes, before it rescans the shared directory
+    rescanfraction = 1/16
+
+    def __init__(self,directory=None,maxbytes=64<<20,maxdiskbytes=1<<30):
+        '''Caches up to maxbytes of renders in memory and, if directory is given, maxdiskbytes on disk'''
+        self.directory = directory
+        self.maxbytes = maxbytes
+        self.maxdiskbytes = maxdiskbytes
+        self.lock = threading.Lock()
+        self.memory = OrderedDict()
+        self.memorybytes = 0
+        #key -> file size, oldest first
+        self.disk = OrderedDict()
+        self.diskbytes = 0
+        #bytes written since the last scan
+        self.written = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self.scan()
+
+    def scan(self):
+        '''reads the entries on disk, written by any process, least recently used first by mtime'''
+        found = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.startswith("."):
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                found.append((st.st_mtime, entry.name, st.st_size))
+        with self.lock:
+            self.disk.clear()
+            for mtime, key, size in sorted(found):
+                self.disk[key] = size
+            self.diskbytes = sum(self.disk.values())
+            self.written = 0
+
+    def __len__(self):
+        return len(self.memory.keys() | self.disk.keys())
+
+    def __contains__(self,key):
+        return key in self.memory or key in self.disk
+
+    def path(self,key):
+        return os.path.join(self.directory, key)
+
+    def get(self,key):
+        '''returns the cached bytes of key or None'''
+        with self.lock:
+            data = self.memory.get(key)
+            if data is not None:
+                self.memory.move_to_end(key)
+                if instrument.enabled: instrument.count("rendercache.memory")
+                return data
+        if not self.directory:
+            return None
+        try:
+            with open(self.path(key), "rb") as f:
+                data = f.read()
+            os.utime(self.path(key))
+        except FileNotFoundError:
+            #evicted, possibly by another process
+            with self.lock:
+                self.diskbytes -= self.disk.pop(key, 0)
+            return None
+        with self.lock:
+            if key not in self.disk:
+                self.disk[key] = len(data)
+                self.diskbytes += len(data)
+            self.disk.move_to_end(key)
+        if instrument.enabled: instrument.count("rendercache.disk")
+        self.remember(key, data)
+        return data
+
+    def remember(self,key,data):
+        '''stores data in the memory cache, evicting the least recently used entries'''
+        if len(data) > self.maxbytes:
+            return
+        with self.lock:
+            self.memorybytes -= len(self.memory.pop(key, b""))
+            self.memory[key] = data
+            self.memorybytes += len(data)
+            while self.memorybytes > self.maxbytes:
+                k, d = self.memory.popitem(last=False)
+                self.memorybytes -= len(d)
+
+    def put(self,key,data):
+        '''stores data under key in memory and on disk'''
+        from . import mapfile
+        data = bytes(data)
+        self.remember(key, data)
+        if not self.directory or len(data) > self.maxdiskbytes:
+            return
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.chmod(tmp, mapfile.filemode(self.path(key)))
+            os.replace(tmp, self.path(key))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        with self.lock:
+            self.diskbytes += len(data) - self.disk.pop(key, 0)
+            self.disk[key] = len(data)
+            self.written += len(data)
+            rescan = (self.diskbytes > self.maxdiskbytes or
+                      self.written >= self.maxdiskbytes * self.rescanfraction)
+        if rescan:
+            #other processes sharing the directory wrote files this one does not know about
+            self.scan()
+        evict = []
+        with self.lock:
+            while self.diskbytes > self.maxdiskbytes:
+                k, size = self.disk.popitem(last=False)
+                self.diskbytes -= size
+                evict.append(k)
+        for k in evict:
+            try:
+                os.unlink(self.path(k))
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        '''removes every entry from memory and disk'''
+        with self.lock:
+            keys = list(self.disk)
+            self.memory.clear()
+            self.memorybytes = 0
+            self.disk.clear()
+            self.diskbytes = 0
+        for k in keys:
+            try:
+                os.unlink(self.path(k))
+            except FileNotFoundError:
+                pass
+
+    def render(self,source,format="png",rescale=None):
+        '''returns the image of the map file source encoded as format, from the cache if its colors,
+        scale and Map.palette are unchanged, rescale is passed to Map.rescale'''
+        from . import Map, mapfile
+        data = mapfile.readmapdata(source, ("colors", "scale"))
+        key = renderkey(data["colors"], Map.palette, data.get("scale", 0), rescale, format)
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+        if instrument.enabled: instrument.count("rendercache.miss")
+        image = renderdata(data, format, rescale)
+        self.put(key, image)
+        return image
+
+
+def getcache(directory,maxbytes=64<<20,maxdiskbytes=1<<30):
+    '''returns the RenderCache of directory shared within this process'''
+    key = os.path.abspath(directory)
+    cache = caches.get(key)
+    if cache is None:
+        cache = caches[key] = RenderCache(directory, maxbytes, maxdiskbytes)
+    return cache
@@ -0,0 +1,59 @@
+'''Converting one large image into a grid of map files for map art.
+
+The whole image is quantized in one pass (so dithering error carries across map
+borders) and then cut into 128x128 maps with consecutive ids, row by row.
+Requires NumPy.
+
+Usage::
+
+ from PIL import Image
+ im = Image.open("mural.png")
+ minecraftmap.tiling.imagetomaps(im,4,3,"saves/Test World/data",firstid=10,originxz=(0,0),dither="floydsteinberg")
+'''
+
+import os
+
+from PIL import Image
+
+from . import quantize
+
+
+def mapcenter(xz,scale=0):
+    '''returns the (xCenter, zCenter) minecraft gives a map of scale created at block xz'''
+    size = 128 * 2 ** scale
+    return tuple((v + 64) // size * size + size // 2 - 64 for v in xz)
+
+
+def imagetomaps(im,columns,rows,outdir,firstid=0,scale=0,originxz=(0,0),dimension=0,dither=None,resample=Image.LANCZOS):
+    '''quantizes im, resized to columns*128 by rows*128 pixels, and writes one map_<id>.dat per 128x128 piece
+    to outdir starting at firstid. The top-left map is centered like one created at block originxz and its
+    neighbours follow at map-sized steps. dither is None, "floydsteinberg" or "bayer", pixels with alpha below
+    128 become transparent either way. Returns the written paths.'''
+    from . import Map
+    size = (128 * columns, 128 * rows)
+    im = im.convert("RGBA")
+    if im.size != size:
+        im = im.resize(size, resample)
+    q = Map.palette.getquantizer()
+    pixels = quantize.imagepixels(im)
+    #with or without dithering, alpha below 128 is transparent and other pixels get opaque colors only
+    codes = q.dither(pixels, dither)
+    codes = quantize.np.frombuffer(codes, dtype=quantize.np.uint8).reshape(size[1], size[0])
+
+    os.makedirs(outdir, exist_ok=True)
+    step = 128 * 2 ** scale
+    x0, z0 = mapcenter(originxz, scale)
+    paths = []
+    for row in range(rows):
+        for col in range(columns):
+            m = Map(eco=True)
+            data = m.file["data"]
+            data["scale"].value = scale
+            data["dimension"].value = dimension
+            data["xCenter"].value = x0 + col * step
+            data["zCenter"].value = z0 + row * step
+            data["colors"].value = bytearray(codes[row*128:(row+1)*128, col*128:(col+1)*128].tobytes())
+            p = os.path.join(outdir, "map_%d.dat" % (firstid + len(paths)))
+            m.savenbt(p)
+            paths.append(p)
+    return paths
@@ -15,6 +15,8 @@ setup(
   include_package_data = True,
   packages         = ["minecraftmap"],
   install_requires = ["Pillow","nbt"],
+  extras_require   = {"numpy": ["numpy"]},
+  entry_points     = {"console_scripts": ["minecraftmap-render = minecraftmap.batch:main"]},
   keywords         = ["minecraft","map","nbt","item"],
   classifiers      = [
         "Development Status :: 2 - Pre-Alpha",
@@ -0,0 +1,45 @@
+'''Random images and maps shared by the tests.'''
+
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from nbt import nbt
+from PIL import Image
+
+import minecraftmap
+
+
+def syntheticimage(seed=0,distinct=2000):
+    '''returns an RGBA image of up to distinct random colors, some transparent and some exact palette colors'''
+    rng = random.Random(seed)
+    colors = [(rng.randrange(256), rng.randrange(256), rng.randrange(256), 255) for i in range(distinct)]
+    colors += [c + (255,) for c in minecraftmap.Map.allcolors[4:60:5]] + [(0, 0, 0, 0)]
+    im = Image.new("RGBA", (128, 128))
+    im.putdata([rng.choice(colors) for i in range(128*128)])
+    return im
+
+
+def syntheticmap(seed=0):
+    '''returns a Map with random colors, metadata and a banner'''
+    rng = random.Random(seed)
+    m = minecraftmap.Map(eco=True)
+    data = m.file["data"]
+    data["scale"].value = 3
+    data["dimension"].value = -1
+    data["xCenter"].value = -1984
+    data["zCenter"].value = 448
+    m.setcolors(bytes(rng.randrange(4, 208) for i in range(128*128)))
+    banners = nbt.TAG_List(name="banners", type=nbt.TAG_Compound)
+    banner = nbt.TAG_Compound()
+    banner.tags.append(nbt.TAG_String(name="Color", value="red"))
+    banner.tags.append(nbt.TAG_String(name="Name", value='{"text":"Base"}'))
+    pos = nbt.TAG_Compound(name="Pos")
+    for axis, v in (("X", -1900), ("Y", 64), ("Z", 500)):
+        pos.tags.append(nbt.TAG_Int(name=axis, value=v))
+    banner.tags.append(pos)
+    banners.tags.append(banner)
+    data.tags.append(banners)
+    return m
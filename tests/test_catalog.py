@@ -0,0 +1,70 @@
+'''Checks of the map catalog.'''
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import minecraftmap
+from minecraftmap import catalog
+
+
+class CatalogTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.data = os.path.join(self.directory, "data")
+        os.mkdir(self.data)
+        self.dbpath = os.path.join(self.directory, "maps.sqlite")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def writemap(self,mapid,xcenter,zcenter,scale=0,dimension=0):
+        m = minecraftmap.Map(eco=True)
+        data = m.file["data"]
+        data["xCenter"].value = xcenter
+        data["zCenter"].value = zcenter
+        data["scale"].value = scale
+        data["dimension"].value = dimension
+        path = os.path.join(self.data, "map_%d.dat" % mapid)
+        m.savenbt(path)
+        return path
+
+    def test_add_and_remove_persist(self):
+        a = self.writemap(0, 0, 0)
+        b = self.writemap(1, 128, 0)
+        cat = catalog.Catalog(self.dbpath)
+        cat.add(a)
+        cat.add(b)
+        cat.remove(a)
+        #a second connection only sees committed changes
+        with catalog.Catalog(self.dbpath) as other:
+            self.assertEqual([e.path for e in other.query()], [b])
+        cat.close()
+
+    def test_queries(self):
+        self.writemap(0, 0, 0)
+        self.writemap(1, 128, 0)
+        self.writemap(2, 0, 0, scale=1)
+        self.writemap(3, 0, 0, dimension=-1)
+        with catalog.Catalog(self.dbpath) as cat:
+            result = cat.update(self.data)
+            self.assertEqual((result["added"], result["failed"]), (4, []))
+            self.assertEqual(len(cat), 4)
+            self.assertEqual([e.id for e in cat.covering((-64, -64), dimension=0)], [0, 2])
+            self.assertEqual([e.id for e in cat.covering((64, 0), dimension=0)], [1, 2])
+            self.assertEqual([e.id for e in cat.covering((200, 0), dimension=0, minscale=1)], [])
+            self.assertEqual([e.id for e in cat.query((-200, -200, 200, 200), maxscale=0)], [0, 1, 3])
+            entry = cat.covering((0, 0), dimension=-1)[0]
+            self.assertEqual((entry.left, entry.top, entry.right, entry.bottom), (-64, -64, 64, 64))
+            os.remove(os.path.join(self.data, "map_1.dat"))
+            self.assertEqual(cat.update(self.data)["removed"], 1)
+        with catalog.Catalog(self.dbpath) as cat:
+            self.assertEqual(len(cat), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+'''Checks of map diffs, deltas and histories.'''
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from minecraftmap import diff
+from synthetic import syntheticmap
+
+
+class DeltaTest(unittest.TestCase):
+    def test_roundtrip(self):
+        rng = random.Random(1)
+        a = bytes(syntheticmap().colors)
+        b = bytearray(a)
+        for i in range(300):
+            b[rng.randrange(len(b))] = rng.randrange(4, 208)
+        b[5000:7000] = bytes(2000)
+        for old, new in ((a, bytes(b)), (a, a), (bytes(b), a)):
+            self.assertEqual(diff.applydelta(old, diff.encodedelta(old, new)), new)
+
+    def test_wrong_base(self):
+        a = bytes(syntheticmap(1).colors)
+        b = bytes(syntheticmap(2).colors)
+        with self.assertRaises(ValueError):
+            diff.applydelta(b, diff.encodedelta(a, b))
+
+
+
+class HistoryTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "map_0.history")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_versions(self):
+        versions = [bytes(syntheticmap(i % 3).colors) for i in range(10)]
+        history = diff.History(self.path)
+        history.keyframeinterval = 4
+        for i, colors in enumerate(versions):
+            history.append(colors, t=i)
+        reopened = diff.History(self.path)
+        self.assertEqual(reopened.times(), list(range(10)))
+        self.assertEqual([bytes(c) for c in reopened], versions)
+        self.assertEqual(bytes(reopened[5]), versions[5])
+
+    def test_partial_record(self):
+        a, b = bytes(syntheticmap(1).colors), bytes(syntheticmap(2).colors)
+        history = diff.History(self.path)
+        history.append(a)
+        history.append(b)
+        with open(self.path, "r+b") as f:
+            f.truncate(os.path.getsize(self.path) - 1)
+        history = diff.History(self.path)
+        self.assertEqual(len(history), 1)
+        history.append(b)
+        self.assertEqual([bytes(c) for c in diff.History(self.path)], [a, b])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+'''Checks of dirty tracking and incremental redraws.'''
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import minecraftmap
+
+
+class DirtyTest(unittest.TestCase):
+    def setUp(self):
+        self.m = minecraftmap.Map(eco=True)
+        self.m.genimage()
+
+    def test_box_covers_writes(self):
+        m = self.m
+        self.assertIsNone(m.dirtybox)
+        m.setpoint((5, 7), 60)
+        self.assertEqual(m.dirtybox, (5, 7, 6, 8))
+        m.setpoints([(20, 3), (9, 30)], [61, 62])
+        self.assertEqual(m.dirtybox, (5, 3, 21, 31))
+        m.fillrect((100, 100, 110, 120), 63)
+        self.assertEqual(m.dirtybox, (5, 3, 110, 120))
+        m.setbyte(127 + 127*128, 64)
+        self.assertEqual(m.dirtybox, (5, 3, 128, 128))
+
+    def test_incremental_matches_full(self):
+        m = self.m
+        m.setpoint((0, 0), 60)
+        m.setpoints([(127, 127), (64, 64)], 61)
+        m.fillrect((10, 20, 30, 40), 62)
+        m.genimage(incremental=True)
+        self.assertIsNone(m.dirtybox)
+        full = minecraftmap.Map(eco=True)
+        full.setcolors(bytes(m.colors))
+        full.genimage()
+        self.assertEqual(m.im.tobytes(), full.im.tobytes())
+
+    def test_outside_points_raise(self):
+        m = self.m
+        before = bytes(m.colors)
+        for xys in ([(200, 0)], [(-1, 0)], [(0, 0), (0, 128)]):
+            with self.subTest(xys=xys):
+                with self.assertRaises(ValueError):
+                    m.setpoints(xys, 60)
+                with self.assertRaises(ValueError):
+                    m.setpoint(xys[-1], 60)
+        with self.assertRaises(IndexError):
+            m.setbyte(-1, 60)
+        self.assertEqual(bytes(m.colors), before)
+        self.assertIsNone(m.dirtybox)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+'''Checks of the rgb -> color code lookup cubes.'''
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import minecraftmap
+from minecraftmap import lookup
+
+
+@unittest.skipIf(lookup.np is None, "NumPy is not installed")
+class LookupCubeTest(unittest.TestCase):
+    #a 6 bit cube is exact at the centers of its cells, the colors it was built from,
+    #and builds far faster than the 8 bit one which is exact everywhere
+    bits = 6
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        cls.m = minecraftmap.Map(eco=True)
+        cls.cube = lookup.getcube(cls.m.allcolors, cls.m.allcolorsinversemap, cls.bits, cls.directory)
+
+    @classmethod
+    def tearDownClass(cls):
+        lookup.cubes.pop(lookup.cubepath(cls.m.allcolors, cls.m.allcolorsinversemap, cls.bits, cls.directory), None)
+        shutil.rmtree(cls.directory)
+
+    def test_matches_scan(self):
+        rng = random.Random(0)
+        center = lambda: rng.randrange(64) * 4 + 2
+        colors = [(center(), center(), center()) for i in range(3000)] + [(2, 2, 2), (254, 254, 254)]
+        expected = [self.m.approximate(c, lookupindex=None) for c in colors]
+        self.assertEqual([self.cube[c] for c in colors], expected)
+        self.assertEqual(list(self.cube.quantize(lookup.np.array(colors))), expected)
+
+    def test_cached_cube(self):
+        path = lookup.cubepath(self.m.allcolors, self.m.allcolorsinversemap, self.bits, self.directory)
+        self.assertTrue(os.path.exists(path))
+        cube = lookup.loadcube(path, self.bits)
+        self.assertEqual(cube.buffer[:], bytes(self.cube.buffer))
+        cube.buffer.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+'''Checks of reading and writing map files without the nbt tag tree.'''
+
+import gzip
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from nbt import nbt
+
+from minecraftmap import mapfile
+from synthetic import syntheticmap
+
+
+class MapFileTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_writenbt_matches_nbt(self):
+        m = syntheticmap()
+        ours = os.path.join(self.directory, "ours.dat")
+        theirs = os.path.join(self.directory, "theirs.dat")
+        mapfile.writenbt(m.file, ours)
+        m.file.write_file(theirs)
+        self.assertEqual(nbt.NBTFile(ours).pretty_tree(), nbt.NBTFile(theirs).pretty_tree())
+        with gzip.open(ours) as a, gzip.open(theirs) as b:
+            self.assertEqual(a.read(), b.read())
+
+    def test_readmapdata_returns_written_values(self):
+        m = syntheticmap()
+        path = os.path.join(self.directory, "map_0.dat")
+        m.savenbt(path)
+        data = mapfile.readmapdata(path)
+        self.assertEqual((data["scale"], data["dimension"], data["xCenter"], data["zCenter"]), (3, -1, -1984, 448))
+        self.assertEqual(data["colors"], m.colors)
+        self.assertEqual(data["banners"], [{"Color": "red", "Name": '{"text":"Base"}',
+                                            "Pos": {"X": -1900, "Y": 64, "Z": 500}}])
+
+    def test_readmapdata_only_names(self):
+        m = syntheticmap()
+        path = os.path.join(self.directory, "map_0.dat")
+        m.savenbt(path)
+        self.assertEqual(mapfile.readmapdata(path, ("scale", "colors")), {"scale": 3, "colors": m.colors})
+
+
+if __name__ == "__main__":
+    unittest.main()
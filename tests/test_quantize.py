@@ -0,0 +1,73 @@
+'''Checks of the vectorized quantizer against the per-pixel one and of dithering.
+
+Run with python -m pytest or python -m unittest discover tests from the repository root.
+'''
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import minecraftmap
+from minecraftmap import metrics, quantize
+from synthetic import syntheticimage
+
+
+@unittest.skipIf(quantize.np is None, "NumPy is not installed")
+class VectorizedTest(unittest.TestCase):
+    def quantized(self,metric,**kwargs):
+        m = minecraftmap.Map(eco=True)
+        m.colormetric = metric
+        m.im = syntheticimage()
+        m.imagetonbt(**kwargs)
+        return bytes(m.colors)
+
+    def test_matches_per_pixel(self):
+        for metric in metrics.metricnames:
+            for optimized in (False, True):
+                with self.subTest(metric=metric, optimized=optimized):
+                    self.assertEqual(self.quantized(metric, optimized=optimized, vectorized=True),
+                                     self.quantized(metric, optimized=optimized))
+
+
+@unittest.skipIf(quantize.np is None, "NumPy is not installed")
+class DitherTest(unittest.TestCase):
+    def setUp(self):
+        self.m = minecraftmap.Map(eco=True)
+        self.q = self.m.palette.getquantizer()
+
+    def test_transparent_and_opaque_codes(self):
+        pixels = quantize.imagepixels(syntheticimage())
+        transparent = (pixels[:, :, 3] < 128).reshape(-1)
+        for method in (None, "bayer", "floydsteinberg"):
+            for metric in metrics.metricnames:
+                with self.subTest(method=method, metric=metric):
+                    codes = quantize.np.frombuffer(self.q.dither(pixels, method, metric=metric), dtype=quantize.np.uint8)
+                    self.assertEqual(set(codes[transparent]), {self.q.transparent})
+                    self.assertGreaterEqual(codes[~transparent].min(), 4)
+                    self.assertLess(codes.max(), len(self.m.allcolors))
+
+    def test_palette_color_is_kept(self):
+        code = self.m.allcolorsinversemap[self.m.allcolors[33]]
+        pixels = quantize.np.full((32, 32, 4), self.m.allcolors[33][:3] + (255,), dtype=quantize.np.uint8)
+        self.assertEqual(set(self.q.dither(pixels, "floydsteinberg")), {code})
+
+    def test_average_color(self):
+        #a flat color between palette colors averages out closer with dithering than without
+        color = (90, 140, 200)
+        pixels = quantize.np.full((64, 64, 3), color, dtype=quantize.np.uint8)
+        palette = quantize.np.array([c[:3] for c in self.m.allcolors], dtype=float)
+        def error(method):
+            codes = quantize.np.frombuffer(self.q.dither(pixels, method), dtype=quantize.np.uint8)
+            return abs(palette[codes].mean(axis=0) - color).sum()
+        self.assertLess(error("floydsteinberg"), error(None) / 4)
+        self.assertLess(error("bayer"), error(None))
+
+    def test_unknown_method(self):
+        with self.assertRaises(ValueError):
+            self.q.dither(quantize.np.zeros((2, 2, 4), dtype=quantize.np.uint8), "random")
+
+
+if __name__ == "__main__":
+    unittest.main()
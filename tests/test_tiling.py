@@ -0,0 +1,56 @@
+'''Checks of cutting one image into a grid of map files.'''
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+
+from minecraftmap import mapfile, quantize, tiling
+
+
+class MapCenterTest(unittest.TestCase):
+    def test_mapcenter(self):
+        self.assertEqual(tiling.mapcenter((0, 0)), (0, 0))
+        self.assertEqual(tiling.mapcenter((63, -64)), (0, 0))
+        self.assertEqual(tiling.mapcenter((64, -65)), (128, -128))
+        self.assertEqual(tiling.mapcenter((100, 100), 1), (64, 64))
+        self.assertEqual(tiling.mapcenter((-1000, 3000), 3), (-576, 2496))
+
+
+@unittest.skipIf(quantize.np is None, "NumPy is not installed")
+class ImageToMapsTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_grid(self):
+        im = Image.new("RGBA", (256, 384), (200, 30, 30, 255))
+        paths = tiling.imagetomaps(im, 2, 3, self.directory, firstid=10, scale=1, originxz=(100, 100), dimension=-1)
+        self.assertEqual([os.path.basename(p) for p in paths], ["map_%d.dat" % i for i in range(10, 16)])
+        centers = []
+        for p in paths:
+            data = mapfile.readmapdata(p, ("scale", "dimension", "xCenter", "zCenter"))
+            self.assertEqual((data["scale"], data["dimension"]), (1, -1))
+            centers.append((data["xCenter"], data["zCenter"]))
+        self.assertEqual(centers, [(64, 64), (320, 64), (64, 320), (320, 320), (64, 576), (320, 576)])
+
+    def test_transparency(self):
+        im = Image.new("RGBA", (128, 128), (0, 0, 0, 255))
+        im.paste((255, 0, 0, 0), (0, 0, 128, 64))
+        for dither in (None, "bayer", "floydsteinberg"):
+            with self.subTest(dither=dither):
+                path = tiling.imagetomaps(im, 1, 1, self.directory, dither=dither)[0]
+                colors = mapfile.readmapdata(path, ("colors",))["colors"]
+                self.assertEqual(set(colors[:64*128]), {3})
+                self.assertTrue(all(c >= 4 for c in colors[64*128:]))
+
+
+if __name__ == "__main__":
+    unittest.main()